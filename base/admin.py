@@ -1,7 +1,49 @@
+import json
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
+
 from .models import ChatSession, ChatMessage, StudyTopic, UserProfile
 
 
+def row_count(queryset):
+    """Number of rows of `queryset` (filtered on an OuterRef) as a correlated subquery.
+    Unlike annotate(Count(...)) it isn't a GROUP BY over the whole table, the
+    database counts only for the rows of the page being listed."""
+    counts = queryset.order_by().annotate(count=Func(F('pk'), function='COUNT')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes the row count of big changelists from the query
+    planner's estimate (PostgreSQL) instead of running an exact COUNT(*)"""
+    #Below this estimate the exact count is cheap enough
+    EXACT_COUNT_BELOW = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self._estimated_count()
+        if estimate is not None and estimate >= self.EXACT_COUNT_BELOW:
+            return estimate
+        return super().count
+
+    def _estimated_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
 
 # Register your models here.
 
@@ -21,28 +63,47 @@ class ChatMessageInline(admin.TabularInline):
     readonly_fields = ['timestamp']
     fields = ['message_type', 'content', 'timestamp']
 
+    def get_queryset(self, request):
+        #Long texts live in MessageBody, load them with the messages
+        return super().get_queryset(request).select_related('body')
+
 @admin.register(ChatSession)
 class ChatSessionAdmin(admin.ModelAdmin):
     """Admin interface for managing chat sessions"""
     list_display = ['user', 'title', 'created_at', 'updated_at', 'message_count']
-    list_filter = ['created_at', 'updated_at']
+    list_filter = ['created_at', 'updated_at', 'is_archived', 'deleted_at']
     search_fields = ['title', 'user__username']
     readonly_fields = ['created_at', 'updated_at']
     inlines = [ChatMessageInline]
+    list_select_related = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            message_count=row_count(ChatMessage.objects.filter(session=OuterRef('pk')))
+        )
 
     def message_count(self, obj):
         """Display the number of messages in each session"""
-        return obj.messages.count()
+        return obj.message_count
     
     message_count.short_description = 'Messages'
+    message_count.admin_order_field = 'message_count'
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
     """Admin interface for managing chat messages"""
     list_display = ['session', 'message_type', 'content_preview', 'timestamp']
     list_filter = [ 'message_type', 'timestamp']
+    #Long messages are stored compressed in MessageBody with an empty `content`,
+    #so the database can't search their text; they are found by session title only
     search_fields = ['session__title', 'content']
+    search_help_text = "Searches session titles and the text of short messages (long messages are stored compressed)."
     readonly_fields = ['timestamp']
+    list_select_related = ['session', 'body']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def content_preview(self, obj):
         """Shows a preview of the message content"""
@@ -58,12 +119,23 @@ class UserProfileAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__email']
     filter_horizontal = ['favourite_subjects']
     readonly_fields = ['created_at']
+    list_select_related = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            favourite_subjects_count=row_count(
+                UserProfile.favourite_subjects.through.objects.filter(userprofile=OuterRef('pk'))
+            )
+        )
 
     def favourite_subjects_count(self, obj):
         """Display the number of favourite subjects for each user"""
-        return obj.favourite_subjects.count()
+        return obj.favourite_subjects_count
     
     favourite_subjects_count.short_description = 'Favourite Subjects'
+    favourite_subjects_count.admin_order_field = 'favourite_subjects_count'
 
 #Customize admin site header and title
 
@@ -0,0 +1,172 @@
+"""Text generation backends for AIService.
+
+The backend is picked by settings.AI_BACKEND from settings.AI_BACKENDS,
+the same way Django picks a cache from CACHES. A backend gets its options
+dict and implements generate(prompt) -> str, and optionally
+generate_batch(prompts) when it can answer several prompts at once."""
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .ai_service import STUDY_RESPONSES, SUBJECT_KEYWORDS, classify_subject
+
+
+class BaseBackend:
+    """Common interface of all backends"""
+
+    def __init__(self, options):
+        self.options = options
+
+    def generate(self, prompt):
+        raise NotImplementedError
+
+    def generate_batch(self, prompts):
+        """One result per prompt, in order"""
+        return [self.generate(prompt) for prompt in prompts]
+
+    def warm_up(self):
+        """Load whatever the first request would otherwise wait for"""
+
+
+class RuleBackend(BaseBackend):
+    """The keyword responder: a canned answer per detected subject"""
+
+    def generate(self, prompt):
+        return STUDY_RESPONSES[classify_subject(prompt)]
+
+    def warm_up(self):
+        for _, keywords in SUBJECT_KEYWORDS:
+            self.generate(keywords[0])
+
+
+class HTTPBackend(BaseBackend):
+    """A hosted model behind an HTTP inference API (Hugging Face style:
+    POST {"inputs": ...}, answers [{"generated_text": ...}])"""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        #requests is only imported by deployments that use this backend
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    session = requests.Session()
+                    if self.options.get('TOKEN'):
+                        session.headers['Authorization'] = f"Bearer {self.options['TOKEN']}"
+                    self._session = session
+        return self._session
+
+    def _post(self, inputs):
+        response = self._get_session().post(
+            self.options['URL'],
+            json={'inputs': inputs, 'parameters': {'return_full_text': False}},
+            timeout=self.options.get('TIMEOUT', 30),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _text(result):
+        if isinstance(result, list):
+            result = result[0] if result else {}
+        return result.get('generated_text', '').strip()
+
+    def generate(self, prompt):
+        return self._text(self._post(prompt))
+
+    def generate_batch(self, prompts):
+        #The inference API takes a list of inputs and answers them in one call
+        results = self._post(prompts)
+        if len(results) != len(prompts):
+            raise ValueError(f"Expected {len(prompts)} results, got {len(results)}")
+        return [self._text(result) for result in results]
+
+    def warm_up(self):
+        self._get_session()
+
+
+class LocalBackend(BaseBackend):
+    """A quantized GGUF model run on the CPU with llama.cpp (llama-cpp-python).
+
+    A llama.cpp context is not thread-safe, so the backend keeps WORKERS model
+    instances in a pool and a request waits for a free one; the weights are
+    mmapped, so extra instances share them and only add their context memory.
+    Models are loaded once per process, in the process that uses them: a
+    model loaded in the gunicorn master would not survive the fork."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        if not options.get('MODEL_PATH'):
+            raise ImproperlyConfigured("The local AI backend needs AI_LOCAL_MODEL_PATH")
+        self.workers = options.get('WORKERS', 1)
+        self._models = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        from llama_cpp import Llama
+
+        models = queue.Queue()
+        for _ in range(self.workers):
+            models.put(Llama(
+                model_path=self.options['MODEL_PATH'],
+                n_ctx=self.options.get('CONTEXT', 2048),
+                n_threads=self.options.get('THREADS', 2),
+                verbose=False,
+            ))
+        return models
+
+    def _ensure_loaded(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._models = self._load()
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='ai-local',
+                    )
+                    self._pid = os.getpid()
+
+    def generate(self, prompt):
+        self._ensure_loaded()
+        model = self._models.get()
+        try:
+            result = model.create_completion(
+                prompt,
+                max_tokens=self.options.get('MAX_TOKENS', 256),
+                temperature=self.options.get('TEMPERATURE', 0.7),
+            )
+        finally:
+            self._models.put(model)
+        return result['choices'][0]['text'].strip()
+
+    def generate_batch(self, prompts):
+        #Spread the batch over the model pool, at most WORKERS run at once
+        self._ensure_loaded()
+        return list(self._executor.map(self.generate, prompts))
+
+    def warm_up(self):
+        self._ensure_loaded()
+
+
+def load_backend(name=None):
+    """Create the backend configured as `name` in settings.AI_BACKENDS"""
+    name = name or settings.AI_BACKEND
+    try:
+        config = dict(settings.AI_BACKENDS[name])
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"AI_BACKEND {name!r} is not one of {', '.join(settings.AI_BACKENDS)}"
+        )
+    backend_class = import_string(config.pop('BACKEND'))
+    return backend_class(config)
@@ -0,0 +1,153 @@
+"""Micro-batching of concurrent generation requests.
+
+Requests from all threads of a process go into one queue. A worker thread
+takes the first waiting request together with any others already queued.
+A lone request is sent right away; only when other callers are waiting too
+does the worker hold the batch open for up to MAX_WAIT_MS (or until
+MAX_BATCH_SIZE) to gather more. The batch goes to the backend as one
+generate_batch call and each caller's future is resolved with its result.
+Requests arriving while a batch is being generated queue up and form the next one."""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """More requests are waiting than MAX_QUEUE allows"""
+
+
+class MicroBatcher:
+    """Per-process batching scheduler in front of a backend"""
+
+    def __init__(self, backend, max_batch_size=8, max_wait_ms=10, max_queue=256):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._metrics = {
+            'requests': 0,
+            'rejected': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'largest_batch': 0,
+            'wait_seconds': 0.0,
+            'longest_wait_seconds': 0.0,
+            'backend_seconds': 0.0,
+        }
+
+    def _ensure_worker(self):
+        #The thread and queue belong to the process that started them; after
+        #a fork (gunicorn preload) the child starts its own
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.max_queue)
+                    self._reset_metrics()
+                    threading.Thread(target=self._run, name='ai-batcher', daemon=True).start()
+                    self._pid = os.getpid()
+
+    def submit(self, prompt):
+        """Queue one prompt, returns a Future with the generated text"""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((prompt, future, time.perf_counter()))
+        except queue.Full:
+            with self._metrics_lock:
+                self._metrics['rejected'] += 1
+            raise QueueFull(f"{self.max_queue} generation requests already waiting")
+        return future
+
+    def _collect(self):
+        """Block for the first request and take the ones already queued with it. Only if
+        there were some (concurrent callers), gather more until the batch is full or the wait is over"""
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(batch) == 1:
+            #Nobody else is waiting, holding the request back would only add latency
+            return batch
+
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            #Callers that gave up (timed out) don't need an answer any more
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            failed = False
+            try:
+                results = self.backend.generate_batch([prompt for prompt, _, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"Backend answered {len(results)} of {len(batch)} prompts")
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                failed = True
+                logger.warning("Batch of %d prompts failed", len(batch), exc_info=True)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            waits = [started - queued_at for _, _, queued_at in batch]
+            with self._metrics_lock:
+                metrics = self._metrics
+                metrics['requests'] += len(batch)
+                metrics['batches'] += 1
+                metrics['failed_batches'] += failed
+                metrics['largest_batch'] = max(metrics['largest_batch'], len(batch))
+                metrics['wait_seconds'] += sum(waits)
+                metrics['longest_wait_seconds'] = max(metrics['longest_wait_seconds'], max(waits))
+                metrics['backend_seconds'] += time.perf_counter() - started
+
+    def metrics(self):
+        """Counters of this process since its worker thread started"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        batches = metrics['batches'] or 1
+        requests = metrics['requests'] or 1
+        return {
+            'pid': os.getpid(),
+            'queue_depth': self._queue.qsize() if self._pid == os.getpid() else 0,
+            'max_queue': self.max_queue,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'requests': metrics['requests'],
+            'rejected': metrics['rejected'],
+            'batches': metrics['batches'],
+            'failed_batches': metrics['failed_batches'],
+            'largest_batch': metrics['largest_batch'],
+            'avg_batch_size': round(metrics['requests'] / batches, 2),
+            'avg_wait_ms': round(metrics['wait_seconds'] / requests * 1000, 2),
+            'longest_wait_ms': round(metrics['longest_wait_seconds'] * 1000, 2),
+            'avg_backend_ms': round(metrics['backend_seconds'] / batches * 1000, 2),
+        }
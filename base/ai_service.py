@@ -1,50 +1,27 @@
-import requests     #making HTTP requests to AI service(talking to websites, APIs, servers)
-import json
+import logging
+import threading
+from concurrent.futures import TimeoutError
+from types import MappingProxyType
+
 from django.conf import settings
 
+from .ai_batching import MicroBatcher
 
 
-class AIService:
-    """Service class to handle AI interactions
-    we'll use a free API  servie for educational responses"""
+logger = logging.getLogger(__name__)
 
-    def __init__(self):
-        #Using a free API service (Hugging Face Inference API as example)
-        self.base_url = "https://api-inference.huggingface.co/models/"
-        self.model = "microsoft/DialoGPT-large"     #Free conversational model  
 
+#Keywords used to detect the subject of a question, checked in this order
+SUBJECT_KEYWORDS = (
+    ('math', ('math', 'mathematics', 'solve', 'calculate')),
+    ('science', ('science', 'biology', 'physics', 'experiment')),
+    ('history', ('history', 'ancient', 'medieval', 'renaissance', 'past', 'civilization')),
+    ('english', ('english', 'grammar', 'spelling', 'writing', 'essay', 'sentence', 'literature')),
+)
 
-    
-    def get_study_response(self, question, context=""):
-        """Get AI response for study-related questions
-        
-        Args:
-            question (str): The student's question
-            context (str): Previous conversation context
-        
-        Returns: 
-            str: AI response"""
-        
-        study_prompt = self._create_study_prompt(question, context)
 
-        try:
-            #Try to get response from AI service
-            response = self._call_ai_api(study_prompt)
-
-            if response:
-                return self._format_response(response)
-            else:
-                #Fallback to rule-based response
-                return self._get_fallback_response(question)
-            
-        except Exception as e:
-            print(f"AI Service Error: {e}")
-            return self._get_fallback_response(question)
-    
-    
-    def _create_study_prompt(self, question, context=""):
-        """Create a study-focused prompt for better educational responses"""
-        prompt = f"""You are a helpful study assistant for students. Please provide a clear, educational response to this question:
+#Prompt sent to the model, formatted with the student's question
+STUDY_PROMPT = """You are a helpful study assistant for students. Please provide a clear, educational response to this question:
 
 Question: {question}
 
@@ -55,33 +32,10 @@ Please:
 4. Encourage further learning
 
 Response: """
-        return prompt
-
-    def _call_ai_api(self, prompt):
-        """Make API call to AI service
-        Note: This is a simplified version. In production, you'd handle authentication, rate limiting, etc.
-        
-        print("Calling AI service...",  prompt)
-        return "Sample response from AI service" """
 
-        try:
-            #Simplified AI response - you can integrate with any AI API
-            #For now, we'll use a mock response that varies based on keywords
-            return self._generate_educational_response(prompt)
-        except Exception as e:
-            print(f"API call failed: {e}")
-            return None
-        
-
-    def _generate_educational_response(self, prompt):
-        """Generate educational responses based on keywords in the question/prompt
-        This is a simplified approach for demo purposes"""
-        prompt_lower = prompt.lower()
-
-        #Math-related response
-        if any(word in prompt_lower for word in ['math', 'mathematics', 'solve', 'calculate']):
-            return {
-                'response': """I'd be happy to help with math! Here are some tips:
+#Canned answers of the keyword responder, one per subject
+STUDY_RESPONSES = MappingProxyType({
+    'math': """I'd be happy to help with math! Here are some tips:
 
 1. **Break down the problems** into smaller steps
 2. **Identify what you know** and what you need to find 
@@ -89,13 +43,9 @@ Response: """
 4. **Show your work** step by step
 5. **Check your answer** by substituting back
 
-What specific math topic are you working on? I can provide more targeted help!"""
-            }
-        
-        #Science-related responses
-        elif any(word in prompt_lower for word in ['science', 'biology', 'physics', 'experiment']):
-            return {
-                'response': """Science is fascinating! Here's how to study science:
+What specific math topic are you working on? I can provide more targeted help!""",
+
+    'science': """Science is fascinating! Here's how to study science:
 1. **Understand the concept** before memorizing facts
 2. **Connect theory to real-world examples**
 3. **Practice with diagrams** and visual aids
@@ -103,13 +53,9 @@ What specific math topic are you working on? I can provide more targeted help!""
 5. **Ask "why" and "how"** questions 
 
 What specific topic interests you most? I can help you explaining specific concepts!
-                """
-            }
-        
-        #History-related responses
-        elif any(word in prompt_lower for word in ['history', 'ancient', 'medieval', 'renaissance', 'past', 'civilization']):
-            return {
-                'response': """History helps us understand the world! Study tips:
+                """,
+
+    'history': """History helps us understand the world! Study tips:
 
 1. **Create timelines** to see connections between events
 2. **Understand cause and effect** relationships
@@ -117,13 +63,9 @@ What specific topic interests you most? I can help you explaining specific conce
 4. **Learn about key figures** and their contributions
 5. **Use maps** to understand geographical context
 
-Which historical period or event are you studying?"""
-            }
-        
-        #Language/English-related responses
-        elif any(word in prompt_lower for word in ['english', 'grammar', 'spelling', 'writing', 'essay', 'sentence', 'literature']):
-            return {
-                'response': """Great question about language arts! Here are some study strategies:
+Which historical period or event are you studying?""",
+
+    'english': """Great question about language arts! Here are some study strategies:
 
 1. **Read actively** - take notes and ask questions
 2. **Practice writing** regularly
@@ -131,13 +73,9 @@ Which historical period or event are you studying?"""
 4. **Build vocabulary** by reading diverse texts
 5. **Analyze literary devices** in stories and poems
 
-What specific language art topic are you interested in?"""
-            }
-        
-        #Default response - general study tips
-        else:
-            return {
-                'response': """I'm here to help with your studies! Here are some general study tips:
+What specific language art topic are you interested in?""",
+
+    'general': """I'm here to help with your studies! Here are some general study tips:
 1.**Create a study schedule** and stick with it
 2.**Find a quiet study space** free from distractions
 3.**Focus on one topic at a time**
@@ -145,8 +83,205 @@ What specific language art topic are you interested in?"""
 5.**Use active learning** - summarize , teach others , make flashcards
 6.**Get enough sleep** and stay healthy
 
-What specific study topic are you interested in? I can provide more specific guidance!"""
-            }
+What specific study topic are you interested in? I can provide more specific guidance!""",
+})
+
+#Answers used when the AI backend fails, picked by question length
+FALLBACK_RESPONSES = (
+    "That's a great question! Let me help you think through this step by step. Can you tell me more about what specifically you're trying to learn?",
+
+    "I'd love to help you with that! Breaking down complex topics into smaller parts often makes them easier to understand. What part would you like to start with?",
+
+    "Excellent question! Learning is all about curiosity. Have you tried looking at this from a different angle or finding real-world examples?",
+
+    "That's an interesting topic to explore! Sometimes it helps to connect new information to things you already know. What related concepts are you familiar with?",
+)
+
+#Study tips per subject, with DEFAULT_SUGGESTIONS for everything else
+STUDY_SUGGESTIONS = MappingProxyType({
+    'math': (
+        "Practice problems daily for 15-30 minutes",
+        "Use visual aids like graphs and diagrams",
+        "Explain solutions out loud to yourself",
+        "Check your work by substituting answers back",
+    ),
+    'science': (
+        "Create concept maps to connect ideas",
+        "Do hands-on experiments when possible",
+        "Watch educational videos for visual learning",
+        "Form study groups to discuss concepts",
+    ),
+    'history': (
+        "Create timeline charts for important events",
+        "Use mnemonic devices for dates and facts",
+        "Read primary sources when available",
+        "Connect historical events to current events",
+    ),
+    'english': (
+        "Read diverse genres and authors",
+        "Keep a vocabulary journal",
+        "Practice writing different types of essays",
+        "Join book clubs or discussion groups",
+    ),
+})
+
+
+DEFAULT_SUGGESTIONS = (
+    "Set specific, achievable study goals",
+    "Use active recall techniques",
+    "Teach the material to someone else",
+    "Take regular breaks to avoid burnout",
+)
+
+
+def classify_subject(text):
+    """Detect the study subject of a question from its keywords
+    
+    Returns: 
+        str: 'math', 'science', 'history', 'english' or 'general'"""
+    text_lower = text.lower()
+    for subject, keywords in SUBJECT_KEYWORDS:
+        if any(word in text_lower for word in keywords):
+            return subject
+    return 'general'
+
+
+class AIService:
+    """Service class to handle AI interactions
+    we'll use a free API  servie for educational responses
+
+    One instance is shared by all threads of a process (see get_ai_service),
+    so it keeps no per-request state and only reads the module-level tables."""
+
+    def __init__(self, backend=None, batching=None):
+        #Text generation backend from settings.AI_BACKEND (ai_backends imports this module)
+        from .ai_backends import load_backend
+        self.backend = backend or load_backend()
+
+        #Concurrent requests are sent to the backend together, see ai_batching.py
+        batching = batching or settings.AI_BATCHING
+        self.timeout = batching['TIMEOUT']
+        self.batcher = None
+        if batching['ENABLED']:
+            self.batcher = MicroBatcher(
+                self.backend,
+                max_batch_size=batching['MAX_BATCH_SIZE'],
+                max_wait_ms=batching['MAX_WAIT_MS'],
+                max_queue=batching['MAX_QUEUE'],
+            )
+
+
+    
+    def get_study_response(self, question, context=""):
+        """Get AI response for study-related questions
+        
+        Args:
+            question (str): The student's question
+            context (str): Previous conversation context
+        
+        Returns: 
+            str: AI response"""
+        
+        study_prompt = self._create_study_prompt(question, context)
+
+        try:
+            #Try to get response from AI service
+            response = self._call_ai_api(study_prompt)
+
+            if response:
+                return self._format_response(response)
+            else:
+                #Fallback to rule-based response
+                return self._get_fallback_response(question)
+            
+        except Exception:
+            logger.exception("AI service error, using the fallback response")
+            return self._get_fallback_response(question)
+    
+    
+    def get_study_responses(self, questions, context=""):
+        """Batched version of get_study_response
+        
+        Args:
+            questions (list): The student's questions
+            context (str): Previous conversation context shared by all questions
+        
+        Returns: 
+            list: One AI response per question, in the same order"""
+        
+        prompts = [self._create_study_prompt(question, context) for question in questions]
+
+        try:
+            #Identical prompts (pasted twice, or the same worksheet line) are generated once
+            unique_prompts = list(dict.fromkeys(prompts))
+            generated = dict(zip(unique_prompts, self._call_ai_api_batch(unique_prompts)))
+        except Exception:
+            logger.exception("AI service error, using fallback responses")
+            generated = {}
+
+        responses = []
+        for question, prompt in zip(questions, prompts):
+            response = generated.get(prompt)
+            if response:
+                responses.append(self._format_response(response))
+            else:
+                responses.append(self._get_fallback_response(question))
+        return responses
+    
+    
+    def _create_study_prompt(self, question, context=""):
+        """Create a study-focused prompt for better educational responses"""
+        return STUDY_PROMPT.format(question=question)
+
+    def _call_ai_api(self, prompt):
+        """Make API call to AI service through the configured backend"""
+
+        try:
+            if self.batcher:
+                return self._batched_result(self.batcher.submit(prompt))
+            return self.backend.generate(prompt)
+        except Exception as e:
+            logger.warning("AI call failed: %s", e)
+            return None
+        
+
+    def _call_ai_api_batch(self, prompts):
+        """Make one API call for several prompts, returns one result per prompt"""
+        if not self.batcher:
+            return self.backend.generate_batch(prompts)
+
+        #Queue them all first so they can share a batch (also with other requests)
+        futures = []
+        for prompt in prompts:
+            try:
+                futures.append(self.batcher.submit(prompt))
+            except Exception as e:
+                logger.warning("AI call failed: %s", e)
+                futures.append(None)
+
+        results = []
+        for future in futures:
+            try:
+                results.append(self._batched_result(future) if future else None)
+            except Exception as e:
+                logger.warning("AI call failed: %s", e)
+                results.append(None)
+        return results
+
+
+    def _batched_result(self, future):
+        """Wait for a queued generation, giving up after AI_BATCHING['TIMEOUT']"""
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()     #drops it if the batcher hasn't picked it up yet
+            raise TimeoutError(f"No answer within {self.timeout}s") from None
+
+
+    def classify_subject(self, text):
+        """Detect the study subject of a question from its keywords"""
+        return classify_subject(text)
+
 
     def _format_response(self, api_response):
         """Format the AI API response for display"""
@@ -161,55 +296,35 @@ What specific study topic are you interested in? I can provide more specific gui
     def _get_fallback_response(self, question):
         """Provide fallback responses when AI service is unavailable"""
 
-        fallback_responses = [
-            "That's a great question! Let me help you think through this step by step. Can you tell me more about what specifically you're trying to learn?",
+        #Simple hash to pick a consistent response for similar questions
+        response_index = len(question) % len(FALLBACK_RESPONSES)
+        return FALLBACK_RESPONSES[response_index]
+    
 
-            "I'd love to help you with that! Breaking down complex topics into smaller parts often makes them easier to understand. What part would you like to start with?",
+    def get_study_suggestions(self, subject):
+        """Get study suggestions based on subject (a shared tuple, don't modify)"""
+        return STUDY_SUGGESTIONS.get(subject.lower(), DEFAULT_SUGGESTIONS)
 
-            "Excellent question! Learning is all about curiosity. Have you tried looking at this from a different angle or finding real-world examples?",
 
-            "That's an interesting topic to explore! Sometimes it helps to connect new information to things you already know. What related concepts are you familiar with?"
-        ]
+    def warm_up(self):
+        """Load the backend and run the lookup paths once, so the first real
+        request of a worker doesn't pay for the cold start"""
+        self.backend.warm_up()
+        for subject, keywords in SUBJECT_KEYWORDS:
+            self.classify_subject(keywords[0])
+            self.get_study_suggestions(subject)
 
-        #Simple hash to pick a consistent response for similar questions
-        response_index = len(question) % len(fallback_responses)
-        return fallback_responses[response_index]
-    
 
-    def get_study_suggestions(self, subject):
-        """Get study suggestions based on subject"""
-        suggestions = {
-            'math': [
-                "Practice problems daily for 15-30 minutes",
-                "Use visual aids like graphs and diagrams",
-                "Explain solutions out loud to yourself",
-                "Check your work by substituting answers back"
-            ],
-            'science': [
-                "Create concept maps to connect ideas",
-                "Do hands-on experiments when possible",
-                "Watch educational videos for visual learning",
-                "Form study groups to discuss concepts"
-            ],
-            'history': [
-                "Create timeline charts for important events",
-                "Use mnemonic devices for dates and facts",
-                "Read primary sources when available",
-                "Connect historical events to current events"
-            ],
-            'english': [
-                "Read diverse genres and authors",
-                "Keep a vocabulary journal",
-                "Practice writing different types of essays",
-                "Join book clubs or discussion groups"
-            ]
-        }
-        
-        return suggestions.get(subject.lower(), [
-            "Set specific, achievable study goals",
-            "Use active recall techniques",
-            "Teach the material to someone else",
-            "Take regular breaks to avoid burnout"
-        ])
+_service = None
+_service_lock = threading.Lock()
 
 
+def get_ai_service():
+    """Shared per-process AIService, created on first use
+    (or at worker boot by gunicorn.conf.py when preloading)"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = AIService()
+    return _service
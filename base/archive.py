@@ -0,0 +1,105 @@
+import gzip
+import json
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatSession, ChatMessage, ChatArchive, MessageBody
+from .db_router import PRIMARY_DB
+
+
+def _pack_messages(messages):
+    """Serialize message rows into gzip-compressed JSON"""
+    #values() skips the field descriptor, resolve shared bodies here (one query)
+    bodies = MessageBody.texts_for(msg['body_id'] for msg in messages if msg['body_id'])
+    payload = [
+        {
+            'id': msg['id'],
+            'message_type': msg['message_type'],
+            'subject': msg['subject'],
+            'content': bodies[msg['body_id']] if msg['body_id'] else msg['content'],
+            'timestamp': msg['timestamp'].isoformat(),
+        }
+        for msg in messages
+    ]
+    return gzip.compress(json.dumps(payload).encode('utf-8'))
+
+
+def unpack_messages(data):
+    """Inverse of _pack_messages"""
+    return json.loads(gzip.decompress(bytes(data)).decode('utf-8'))
+
+
+def archive_sessions(session_ids, cutoff):
+    """Move the messages of the given sessions into ChatArchive rows.
+
+    Runs as one short transaction, so callers should pass small batches.
+    Sessions that became active again after `cutoff` are skipped.
+    Returns (sessions archived, messages removed)."""
+    with transaction.atomic():
+        sessions = list(
+            ChatSession.active.select_for_update()
+            .filter(id__in=session_ids, is_archived=False, updated_at__lt=cutoff)
+            .values_list('id', flat=True)
+        )
+        if not sessions:
+            return 0, 0
+
+        grouped = {session_id: [] for session_id in sessions}
+        rows = (
+            ChatMessage.objects.filter(session_id__in=sessions)
+            .order_by('session_id', 'id')
+            .values('id', 'session_id', 'message_type', 'subject', 'content', 'body_id', 'timestamp')
+        )
+        for row in rows.iterator(chunk_size=2000):
+            grouped[row['session_id']].append(row)
+
+        ChatArchive.objects.bulk_create([
+            ChatArchive(session_id=session_id, message_count=len(msgs), data=_pack_messages(msgs))
+            for session_id, msgs in grouped.items()
+        ])
+        #No signals or cascades hang off ChatMessage, so this is a single DELETE
+        deleted, _ = ChatMessage.objects.filter(session_id__in=sessions).delete()
+        #update() leaves updated_at alone so history ordering does not change
+        ChatSession.objects.filter(id__in=sessions).update(is_archived=True)
+
+    return len(sessions), deleted
+
+
+def restore_session(chat_session):
+    """Bring an archived session's messages back into ChatMessage.
+
+    Everything here runs on the primary, also when called from a
+    @read_from_replica view: the archive row is locked and the restored
+    rows must be read back before the replica has them.
+    Returns the session's messages in conversation order."""
+    with transaction.atomic(using=PRIMARY_DB):
+        archive = (
+            ChatArchive.objects.using(PRIMARY_DB).select_for_update()
+            .filter(session_id=chat_session.id).first()
+        )
+        if archive is not None:
+            stored = unpack_messages(archive.data)
+            restored = [
+                ChatMessage(
+                    id=msg['id'],
+                    session=chat_session,
+                    message_type=msg['message_type'],
+                    subject=msg.get('subject', ''),
+                    content=msg['content'],
+                )
+                for msg in stored
+            ]
+            ChatMessage.objects.using(PRIMARY_DB).bulk_create(restored)
+
+            #auto_now_add overwrote the timestamps on insert, put the originals back
+            for message, msg in zip(restored, stored):
+                message.timestamp = parse_datetime(msg['timestamp'])
+            ChatMessage.objects.using(PRIMARY_DB).bulk_update(restored, ['timestamp'], batch_size=500)
+
+            archive.delete(using=PRIMARY_DB)
+
+        ChatSession.objects.using(PRIMARY_DB).filter(id=chat_session.id).update(is_archived=False)
+        chat_session.is_archived = False
+
+    return list(ChatMessage.objects.using(PRIMARY_DB).filter(session_id=chat_session.id).select_related('body'))
@@ -0,0 +1,70 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+
+REPLICA_DB = 'replica'
+PRIMARY_DB = 'default'
+
+#Session key holding the time until which this user's reads stay on the primary
+PRIMARY_PIN_KEY = '_db_primary_until'
+
+#Only our own app's tables are routed; auth/sessions/admin always use the primary
+ROUTED_APPS = {'base'}
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    """True when a read replica is defined in settings.DATABASES"""
+    return REPLICA_DB in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    """Database router that sends reads from read-only views to the replica
+
+    Reads only go to the replica inside a view wrapped with @read_from_replica,
+    so every other code path (writes, management commands, admin) keeps
+    reading its own writes from the primary."""
+
+    def db_for_read(self, model, **hints):
+        if (model._meta.app_label in ROUTED_APPS
+                and _use_replica.get()
+                and replica_configured()):
+            return REPLICA_DB
+        return PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #Primary and replica hold the same data, so relations are always fine
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+def pin_to_primary(request):
+    """Keep this user's reads on the primary for a few seconds after a write,
+    so the next page load sees the write even if the replica is lagging"""
+    request.session[PRIMARY_PIN_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+
+
+def is_pinned_to_primary(request):
+    """Check if the user wrote recently and must read from the primary"""
+    return request.session.get(PRIMARY_PIN_KEY, 0) > time.time()
+
+
+def read_from_replica(view_func):
+    """Decorator for read-only views: route their queries to the replica"""
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        token = _use_replica.set(not is_pinned_to_primary(request))
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return _wrapped_view
@@ -0,0 +1,77 @@
+"""Deleting chat sessions without long transactions.
+
+Deletion is two steps. The user-facing step only sets deleted_at (one
+UPDATE), which hides the sessions right away. The purge step removes the
+rows in small batches, each its own short transaction: inline for small
+sessions, and through `manage.py purge_deleted_chats` for big ones."""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import ChatArchive, ChatMessage, ChatSession
+
+
+def soft_delete_sessions(sessions):
+    """Hide the given sessions (a ChatSession queryset). Returns their ids."""
+    session_ids = list(sessions.values_list('id', flat=True))
+    ChatSession.objects.filter(id__in=session_ids).update(deleted_at=timezone.now())
+    return session_ids
+
+
+def purge_session(session_id, batch_size=None):
+    """Remove a soft-deleted session and its messages, `batch_size` messages
+    per transaction. Returns the number of messages removed."""
+    batch_size = batch_size or settings.CHAT_DELETE_BATCH_SIZE
+    removed = 0
+    while True:
+        ids = list(
+            ChatMessage.objects.filter(session_id=session_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        #ChatMessage has no dependents or signals, so this is a plain DELETE
+        deleted, _ = ChatMessage.objects.filter(id__in=ids).delete()
+        removed += deleted
+
+    with transaction.atomic():
+        ChatArchive.objects.filter(session_id=session_id).delete()
+        ChatSession.objects.filter(id=session_id, deleted_at__isnull=False).delete()
+    return removed
+
+
+def purge_inline(session_ids):
+    """Purge now as many of the deleted sessions as fit in one request's budget
+    of CHAT_DELETE_INLINE_MAX_MESSAGES messages, smallest first. The rest is
+    left for `purge_deleted_chats`. Returns the ids purged."""
+    sessions = (
+        ChatSession.objects.filter(id__in=session_ids, deleted_at__isnull=False)
+        .annotate(message_count=Count('messages'))
+        .order_by('message_count')
+        .values_list('id', 'message_count')
+    )
+    budget = settings.CHAT_DELETE_INLINE_MAX_MESSAGES
+    purged = []
+    for session_id, message_count in sessions:
+        if message_count > budget:
+            break
+        purge_session(session_id)
+        budget -= message_count
+        purged.append(session_id)
+    return purged
+
+
+def delete_user_account(user):
+    """Delete a user without cascading into their chat history in one transaction.
+
+    The sessions are detached and soft-deleted, the user row and its small
+    per-user tables go right away, and the messages are purged in batches."""
+    sessions = ChatSession.objects.filter(user=user)
+    session_ids = list(sessions.values_list('id', flat=True))
+    with transaction.atomic():
+        sessions.update(user=None, deleted_at=timezone.now())
+        user.delete()
+    return purge_inline(session_ids)
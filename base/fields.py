@@ -0,0 +1,59 @@
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+
+class PackedTextDescriptor(DeferredAttribute):
+    """Resolve the text from the referenced MessageBody when it isn't stored inline"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        body_id = getattr(instance, self.field.body_attname)
+        if not value and body_id:
+            #Decompressed lazily, on first access only
+            body_field = instance._meta.get_field(self.field.body_field)
+            body = body_field.get_cached_value(instance, default=None)
+            if body is not None:
+                value = body.text       #loaded with select_related(), no extra query
+            else:
+                value = self.field.body_model.text_for(body_id)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        #Defining __set__ makes this a data descriptor, so __get__ runs even
+        #when the (empty) column value is already in instance.__dict__
+        instance.__dict__[self.field.attname] = value
+
+
+class PackedTextField(models.TextField):
+    """TextField whose value can live in a shared, compressed MessageBody row.
+
+    When the instance references a body, the column is saved empty and the
+    text is read back from the body on access. Which rows get a body is
+    decided by the model (see ChatMessage.pack)."""
+    descriptor_class = PackedTextDescriptor
+
+    def __init__(self, *args, body_field='body', **kwargs):
+        self.body_field = body_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.body_field != 'body':
+            kwargs['body_field'] = self.body_field
+        return name, path, args, kwargs
+
+    @property
+    def body_attname(self):
+        return self.model._meta.get_field(self.body_field).attname
+
+    @property
+    def body_model(self):
+        return self.model._meta.get_field(self.body_field).related_model
+
+    def pre_save(self, model_instance, add):
+        if getattr(model_instance, self.body_attname):
+            return ''
+        return super().pre_save(model_instance, add)
@@ -0,0 +1,123 @@
+"""Logging that stays off the request's critical path.
+
+Request threads only copy each record into a queue (BackgroundHandler); a
+listener thread per process formats it (JSONFormatter) and writes it out.
+Every record carries the id of the request that logged it, set by
+RequestIDMiddleware. High-volume loggers can be sampled (SamplingFilter)."""
+
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+#Id of the request being handled in this thread, '-' outside requests
+request_id = ContextVar('request_id', default='-')
+
+#Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+class BackgroundHandler(QueueHandler):
+    """Queues records for a listener thread that writes them to `stream`.
+
+    Never blocks the caller: when `max_queue` records are already waiting the
+    record is dropped and counted. The queue and thread belong to the process
+    that started them, so a forked gunicorn worker starts its own."""
+
+    def __init__(self, stream=None, max_queue=10000):
+        super().__init__(None)
+        self.target = logging.StreamHandler(stream)
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        #Formatting happens in the listener thread
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self.queue = queue.Queue(maxsize=self.max_queue)
+                    self.dropped = 0
+                    self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+                    self.listener.start()
+                    self._pid = os.getpid()
+
+    def prepare(self, record):
+        """Copy what the listener needs from the record while still in the caller's thread"""
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f"Dropped {self.dropped} log records, the log queue was full",
+                    'request_id': record.request_id,
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        #Called by logging.shutdown() at exit: write out what is still queued
+        if self._pid == os.getpid():
+            self.listener.stop()
+            self._pid = None
+        self.target.close()
+        super().close()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the request id and any `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None) or request_id.get(),
+            'process': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through `rate` (0-1) of the records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
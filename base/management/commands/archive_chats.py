@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.archive import archive_sessions
+from base.models import ChatSession
+
+
+class Command(BaseCommand):
+    help = 'Move messages of inactive chat sessions into compressed archive storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+            help='Archive sessions not updated for this many days',
+        )
+        parser.add_argument('--batch-size', type=int, default=20, help='Sessions per transaction')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        candidates = ChatSession.active.filter(is_archived=False, updated_at__lt=cutoff).order_by('id')
+
+        if options['dry_run']:
+            self.stdout.write(f"{candidates.count()} sessions inactive since {cutoff:%Y-%m-%d} would be archived.")
+            return
+
+        total_sessions = total_messages = 0
+        last_id = 0
+        while True:
+            #Walk by primary key so every batch is a cheap index range scan
+            batch = list(candidates.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            sessions, removed = archive_sessions(batch, cutoff)
+            total_sessions += sessions
+            total_messages += removed
+            self.stdout.write(f"Archived {total_sessions} sessions ({total_messages} messages) so far...")
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully archived {total_sessions} sessions and {total_messages} messages."
+            )
+        )
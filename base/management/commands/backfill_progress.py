@@ -0,0 +1,54 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from base.ai_service import get_ai_service
+from base.models import JobCheckpoint
+from base.progress import rebuild_user_progress
+
+
+CHECKPOINT_NAME = 'backfill_progress'
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the StudyProgress rollups of past days from chat history, resuming where the last run stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the first user')
+        parser.add_argument('--batch-size', type=int, default=100, help='Users between checkpoint saves')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+        if options['restart']:
+            checkpoint.position = 0
+            checkpoint.save()
+
+        classify_subject = get_ai_service().classify_subject
+        users_done = messages_done = 0
+
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=checkpoint.position)
+                .order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not user_ids:
+                break
+
+            for user_id in user_ids:
+                messages_done += rebuild_user_progress(user_id, classify_subject)
+                users_done += 1
+
+            #Everything up to this user is done, a rerun continues after it
+            checkpoint.position = user_ids[-1]
+            checkpoint.save()
+            self.stdout.write(f"Processed {users_done} users ({messages_done} messages), up to user id {checkpoint.position}...")
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Successfully rebuilt progress for {users_done} users.")
+        )
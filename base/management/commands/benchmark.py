@@ -0,0 +1,435 @@
+import copy
+import gzip
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _sqlite_writer(db_path, pragmas, begin, timeout, writes, results):
+    """One worker process doing send_message-shaped write transactions"""
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    for pragma in pragmas:
+        conn.execute(pragma)
+
+    done = errors = 0
+    for i in range(writes):
+        try:
+            conn.execute(begin)
+            #user message, AI message and the session touch, like send_message
+            conn.execute("INSERT INTO message (session_id, content) VALUES (?, ?)", (os.getpid(), f"question {i}"))
+            conn.execute("INSERT INTO message (session_id, content) VALUES (?, ?)", (os.getpid(), "answer " * 50))
+            conn.execute("UPDATE session SET updated = ? WHERE id = 1", (time.time(),))
+            conn.execute("COMMIT")
+            done += 1
+        except sqlite3.OperationalError:
+            #"database is locked"
+            errors += 1
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+    conn.close()
+    results.put((done, errors))
+
+
+def bench_sqlite_writes(command, options):
+    """Multi-process write throughput with the default SQLite setup vs SQLITE_PRAGMAS"""
+    profiles = [
+        ('default', [], 'BEGIN', 5.0),
+        ('tuned', settings.SQLITE_PRAGMAS, 'BEGIN IMMEDIATE', settings.SQLITE_BUSY_TIMEOUT),
+    ]
+    workers = options['workers']
+    writes = options['iterations']
+
+    for name, pragmas, begin, timeout in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.sqlite3')
+            conn = sqlite3.connect(db_path)
+            conn.execute("CREATE TABLE message (id INTEGER PRIMARY KEY, session_id INTEGER, content TEXT)")
+            conn.execute("CREATE TABLE session (id INTEGER PRIMARY KEY, updated REAL)")
+            conn.execute("INSERT INTO session (id, updated) VALUES (1, 0)")
+            conn.commit()
+            conn.close()
+
+            results = multiprocessing.Queue()
+            procs = [
+                multiprocessing.Process(target=_sqlite_writer, args=(db_path, pragmas, begin, timeout, writes, results))
+                for _ in range(workers)
+            ]
+            start = time.perf_counter()
+            for proc in procs:
+                proc.start()
+            totals = [results.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+            elapsed = time.perf_counter() - start
+
+        done = sum(t[0] for t in totals)
+        errors = sum(t[1] for t in totals)
+        command.stdout.write(
+            f"{name:>8}: {done} commits, {errors} locked errors, "
+            f"{elapsed:.2f}s, {done / elapsed:.0f} tx/s ({workers} workers)"
+        )
+
+
+#What a web worker imports before it can serve its first request
+_WORKER_BOOT = (
+    "import os;"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'study_assistant.settings');"
+    "import django;"
+    "django.setup();"
+    "from django.urls import get_resolver;"
+    "get_resolver().url_patterns"
+)
+
+
+def bench_import_time(command, options):
+    """Cold-start import cost of a worker, measured with python -X importtime"""
+    runs = []
+    for _ in range(options['iterations']):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _WORKER_BOOT],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        #Lines look like "import time:  self [us] | cumulative | package"
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            modules.append((int(cumulative), name.rstrip()[1:]))
+        #Top-level imports have no indentation, their cumulative times add up to the total
+        total = sum(us for us, name in modules if not name.startswith(' '))
+        runs.append((total, modules))
+
+    total, modules = min(runs, key=lambda run: run[0])
+    command.stdout.write(f"Total import time: {total / 1000:.1f} ms (best of {len(runs)})")
+    command.stdout.write("Slowest top-level imports:")
+    top_level = sorted((m for m in modules if not m[1].startswith(' ')), reverse=True)
+    for us, name in top_level[:10]:
+        command.stdout.write(f"  {us / 1000:8.1f} ms  {name.strip()}")
+
+    budget = options['budget_ms']
+    if budget and total / 1000 > budget:
+        raise CommandError(f"Import time {total / 1000:.1f} ms is over the {budget} ms budget")
+
+
+def bench_ai_throughput(command, options):
+    """Responses/s of a per-request vs the shared AIService under a thread pool,
+    plus what one call on the shared instance allocates"""
+    from base.ai_backends import load_backend
+    from base.ai_service import AIService, DEFAULT_SUGGESTIONS, STUDY_RESPONSES, STUDY_SUGGESTIONS
+
+    words = ('solve', 'biology', 'ancient', 'essay', 'homework')
+    questions = [f"{words[i % len(words)]} question {i}" for i in range(options['workers'] * options['iterations'])]
+    #The rule backend, whatever AI_BACKEND is: this measures AIService itself
+    shared = AIService(load_backend('rules'))
+    shared.warm_up()
+
+    def per_request(question):
+        return AIService(load_backend('rules')).get_study_response(question)
+
+    for name, respond in (('per-request', per_request), ('shared', shared.get_study_response)):
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            start = time.perf_counter()
+            list(pool.map(respond, questions))
+            elapsed = time.perf_counter() - start
+        command.stdout.write(
+            f"{name:>11}: {len(questions)} responses, {elapsed:.3f}s, "
+            f"{len(questions) / elapsed:.0f} responses/s ({options['workers']} threads)"
+        )
+
+    #The answers and tips must be the shared tables themselves, not per-call copies
+    shared_tips = list(STUDY_SUGGESTIONS.values()) + [DEFAULT_SUGGESTIONS]
+    worst = 0
+    tracemalloc.start()
+    for question in questions:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        response = shared.get_study_response(question)
+        tips = shared.get_study_suggestions(shared.classify_subject(question))
+        _, peak = tracemalloc.get_traced_memory()
+        worst = max(worst, peak - before)
+        if not any(response is text for text in STUDY_RESPONSES.values()):
+            raise CommandError("get_study_response built its answer per call")
+        if not any(tips is shared_list for shared_list in shared_tips):
+            raise CommandError("get_study_suggestions built its tips per call")
+    tracemalloc.stop()
+    command.stdout.write(f"Largest allocation during one call: {worst} B")
+
+
+class _SimulatedModel:
+    """Stands in for a local model: one generation at a time, a fixed cost per
+    call plus a smaller cost per prompt (batched prompts share the fixed part)"""
+
+    def __init__(self, call_ms=4.0, prompt_ms=0.5):
+        self.call_seconds = call_ms / 1000
+        self.prompt_seconds = prompt_ms / 1000
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        return self.generate_batch([prompt])[0]
+
+    def generate_batch(self, prompts):
+        with self.lock:
+            time.sleep(self.call_seconds + self.prompt_seconds * len(prompts))
+        return [f"answer to {prompt}" for prompt in prompts]
+
+    def warm_up(self):
+        pass
+
+
+def bench_ai_batching(command, options):
+    """get_study_response calls against a simulated model, with and without micro-batching,
+    one at a time (a sync worker) and from concurrent threads (a threaded worker)"""
+    from base.ai_service import AIService
+
+    profiles = [
+        ('unbatched', dict(settings.AI_BATCHING, ENABLED=False)),
+        ('batched', dict(settings.AI_BATCHING, ENABLED=True)),
+    ]
+    for threads in sorted({1, options['workers']}):
+        questions = [f"question {i}" for i in range(threads * options['iterations'])]
+        for name, batching in profiles:
+            service = AIService(_SimulatedModel(), batching=batching)
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                start = time.perf_counter()
+                list(pool.map(service.get_study_response, questions))
+                elapsed = time.perf_counter() - start
+            command.stdout.write(
+                f"{name:>9}: {len(questions)} responses, {elapsed:.2f}s, "
+                f"{len(questions) / elapsed:.0f} responses/s, "
+                f"{elapsed / len(questions) * threads * 1000:.2f} ms each ({threads} threads)"
+            )
+            if service.batcher:
+                metrics = service.batcher.metrics()
+                command.stdout.write(
+                    f"           {metrics['batches']} batches, avg size {metrics['avg_batch_size']}, "
+                    f"avg wait {metrics['avg_wait_ms']} ms, longest {metrics['longest_wait_ms']} ms"
+                )
+
+
+#Pages and the URL they are rendered from
+_STATIC_PAGES = (
+    ('home', '/'),
+    ('chat', '/chat/'),
+    ('chat_history', '/chat/history/'),
+    ('study_topics', '/topics/'),
+)
+
+
+def bench_static_sizes(command, options):
+    """Bytes per page: the HTML, its static bundles (minified, gzip, Brotli) and what
+    a first and a repeat visit transfer. Needs a `collectstatic` run first."""
+    from django.contrib.auth.models import User
+    from django.contrib.staticfiles import finders
+    from django.contrib.staticfiles.storage import staticfiles_storage
+    from django.db import transaction
+    from django.test import Client
+
+    def size(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    asset_urls = re.compile(r'(?:src|href)="' + re.escape(settings.STATIC_URL) + r'([^"]+)"')
+    hashed_to_name = {}
+    try:
+        for name in ('css', 'js'):
+            for found in sorted(finders.find(name, find_all=True) or []):
+                for filename in os.listdir(found):
+                    path = f"{name}/{filename}"
+                    hashed_to_name[staticfiles_storage.stored_name(path)] = path
+    except ValueError as e:
+        raise CommandError(f"{e}. Run `manage.py collectstatic` first.")
+
+    with transaction.atomic():
+        #A throwaway user, rolled back at the end
+        user = User.objects.create_user('benchmark-static-sizes')
+        client = Client(HTTP_HOST=(settings.ALLOWED_HOSTS or ['localhost'])[0].lstrip('.') or 'localhost')
+        client.force_login(user)
+
+        for page, url in _STATIC_PAGES:
+            html = client.get(url).content
+            html_gz = len(gzip.compress(html))
+            first = repeat = html_gz
+            inline = html
+            command.stdout.write(f"{page} ({url}): HTML {len(html)} B, {html_gz} B gzip")
+            for hashed in asset_urls.findall(html.decode('utf-8')):
+                path = staticfiles_storage.path(hashed)
+                source = finders.find(hashed_to_name.get(hashed, hashed))
+                br = size(path + '.br') or size(path + '.gz') or size(path)
+                first += br
+                if source:
+                    with open(source, 'rb') as f:
+                        inline += f.read()
+                command.stdout.write(
+                    f"  {hashed}: {size(source) if source else '-'} B source, {size(path)} B minified, "
+                    f"{size(path + '.gz')} B gzip, {size(path + '.br')} B br"
+                )
+            command.stdout.write(
+                f"  transfer: first visit {first} B, repeat visit {repeat} B "
+                f"(inline equivalent: {len(gzip.compress(inline))} B every visit)"
+            )
+        transaction.set_rollback(True)
+
+
+#No logging at all, and the setup settings.LOGGING replaced: everything at
+#DEBUG, written synchronously by the thread that logs
+_NO_LOGGING = {'version': 1, 'disable_existing_loggers': False, 'root': {'level': 'CRITICAL'}}
+_SYNC_DEBUG_LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'root': {'handlers': ['console'], 'level': 'DEBUG'},
+}
+
+
+class _SlowStream:
+    """A stream whose writes take `seconds`, like a stdout pipe the log shipper is behind on"""
+
+    def __init__(self, stream, seconds):
+        self.stream = stream
+        self.seconds = seconds
+
+    def write(self, text):
+        time.sleep(self.seconds)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def _configure_logging(config, stream):
+    """Apply a LOGGING dict the way Django does at startup, with its handlers writing to `stream`"""
+    from django.utils.log import configure_logging
+
+    #dictConfig adds filters to loggers it configures again instead of replacing them
+    for logger in [logging.getLogger(), *logging.Logger.manager.loggerDict.values()]:
+        if isinstance(logger, logging.Logger):
+            logger.filters.clear()
+    config = copy.deepcopy(config)
+    for handler in config.get('handlers', {}).values():
+        handler['stream'] = stream
+    configure_logging(settings.LOGGING_CONFIG, config)
+
+
+def _drain_logging():
+    #Closing the handlers writes out whatever a background handler still has queued
+    for handler in logging.getLogger().handlers:
+        handler.close()
+
+
+def bench_logging_overhead(command, options):
+    """Per-request time of send_message with no logging, the old synchronous DEBUG
+    logging and settings.LOGGING (best of 5 alternating rounds), then what one
+    warning costs the thread that logs it. Everything is written to a file."""
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.test import Client, override_settings
+
+    def send(client, session_id, i):
+        response = client.post(
+            '/chat/send/', {'message': f"solve question {i}", 'session_id': session_id},
+            content_type='application/json',
+        )
+        return response.json()['session_id']
+
+    #The old setup had no request ids or access log, so it runs without RequestIDMiddleware
+    legacy_middleware = [m for m in settings.MIDDLEWARE if m != 'base.middleware.RequestIDMiddleware']
+    profiles = [
+        ('none', _NO_LOGGING, legacy_middleware),
+        ('before', _SYNC_DEBUG_LOGGING, legacy_middleware),
+        ('after', settings.LOGGING, settings.MIDDLEWARE),
+    ]
+    requests = options['iterations']
+    records = options['workers'] * options['iterations']
+    host = (settings.ALLOWED_HOSTS or ['localhost'])[0].lstrip('.') or 'localhost'
+    with tempfile.TemporaryFile('w+') as out, override_settings(RATELIMIT_ENABLED=False), transaction.atomic():
+        #A throwaway user, rolled back at the end
+        user = User.objects.create_user('benchmark-logging-overhead')
+        try:
+            clients = {}
+            for name, _, middleware in profiles:
+                #A client loads the middleware on its first request, warm each one up under its own list
+                with override_settings(MIDDLEWARE=middleware):
+                    clients[name] = Client(HTTP_HOST=host)
+                    clients[name].force_login(user)
+                    session_id = None
+                    for i in range(20):
+                        session_id = send(clients[name], session_id, i)
+
+            best = {}
+            written = {}
+            for _ in range(5):
+                for name, config, _ in profiles:
+                    _configure_logging(config, out)
+                    written_from = out.tell()
+                    session_id = None       #a new chat each round, a longer one is slower to answer
+                    start = time.perf_counter()
+                    for i in range(requests):
+                        session_id = send(clients[name], session_id, i)
+                    elapsed = time.perf_counter() - start
+                    _drain_logging()
+                    out.seek(written_from)
+                    written[name] = out.read()
+                    best[name] = min(best.get(name, elapsed), elapsed)
+
+            for name, _, _ in profiles:
+                per_request = best[name] / requests * 1000
+                command.stdout.write(
+                    f"{name:>6}: {per_request:.3f} ms/request "
+                    f"({per_request - best['none'] / requests * 1000:+.3f} ms for logging), "
+                    f"{written[name].count(chr(10)) / requests:.2f} lines and "
+                    f"{len(written[name]) / requests:.0f} B logged per request"
+                )
+
+            #Like an AI fallback, logged while stdout is fast (a file) and backed up (1 ms per write)
+            logger = logging.getLogger('base.ai_service')
+            error = TimeoutError("No answer within 60s")
+            for sink, stream in (('file', out), ('slow pipe', _SlowStream(out, 0.001))):
+                for name, config, _ in profiles[1:]:
+                    _configure_logging(config, stream)
+                    start = time.perf_counter()
+                    for _ in range(records):
+                        logger.warning("AI call failed: %s", error)
+                    elapsed = time.perf_counter() - start
+                    _drain_logging()
+                    command.stdout.write(
+                        f"{name:>6}, {sink}: {elapsed / records * 1e6:.1f} us per warning in the logging thread"
+                    )
+        finally:
+            _configure_logging(settings.LOGGING, sys.stdout)
+            transaction.set_rollback(True)
+
+
+BENCHMARKS = {
+    'sqlite_writes': bench_sqlite_writes,
+    'import_time': bench_import_time,
+    'ai_throughput': bench_ai_throughput,
+    'ai_batching': bench_ai_batching,
+    'static_sizes': bench_static_sizes,
+    'logging_overhead': bench_logging_overhead,
+}
+
+
+class Command(BaseCommand):
+    help = 'Run a performance benchmark and print the results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS), help='Benchmark to run')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent workers')
+        parser.add_argument('--iterations', type=int, default=200, help='Iterations per worker')
+        parser.add_argument('--budget-ms', type=float, default=None, help='Fail if import_time exceeds this')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Running {options['name']}..."))
+        BENCHMARKS[options['name']](self, options)
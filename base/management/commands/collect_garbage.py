@@ -0,0 +1,122 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.deletion import purge_session, soft_delete_sessions
+from base.models import ChatMessage, ChatSession, MessageBody
+
+
+#Session engines that keep their rows in django_session
+DB_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+class Command(BaseCommand):
+    help = 'Delete expired login sessions, empty or orphaned chat sessions and unused message bodies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches')
+        parser.add_argument(
+            '--grace-hours', type=int, default=24,
+            help='Leave empty chat sessions and message bodies used more recently than this alone',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted')
+
+    def handle(self, *args, **options):
+        self.options = options
+        now = timezone.now()
+        grace_cutoff = now - timedelta(hours=options['grace_hours'])
+
+        if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+            self._collect(
+                'expired login sessions',
+                Session.objects.filter(expire_date__lt=now).order_by('pk'),
+                self._delete_rows,
+            )
+
+        #Sessions left without a user are soft-deleted and purged like deleted ones
+        self._collect(
+            'chat sessions without a user',
+            ChatSession.objects.filter(user__isnull=True).order_by('pk'),
+            self._purge_chat_sessions,
+        )
+
+        #Opened but never used, or emptied; archived sessions keep their messages elsewhere
+        self._collect(
+            'empty chat sessions',
+            ChatSession.objects.filter(
+                is_archived=False, updated_at__lt=grace_cutoff, messages__isnull=True,
+            ).order_by('pk'),
+            self._purge_chat_sessions,
+        )
+
+        self._collect(
+            'unused message bodies',
+            MessageBody.objects.filter(last_used_at__lt=grace_cutoff).order_by('pk'),
+            self._delete_unused_bodies,
+            #Most bodies are in use, so this pass walks the whole table and filters per batch
+            filter_batch=self._unused_bodies,
+        )
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS("Successfully collected garbage."))
+
+    def _collect(self, label, candidates, delete, filter_batch=None):
+        """Walk `candidates` by primary key in batches and delete each batch"""
+        if self.options['dry_run'] and filter_batch is None:
+            self.stdout.write(f"{candidates.count()} {label} would be deleted.")
+            return
+
+        found = deleted = 0
+        last_pk = None
+        while True:
+            batch = candidates if last_pk is None else candidates.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:self.options['batch_size']])
+            if not pks:
+                break
+            last_pk = pks[-1]
+
+            if filter_batch:
+                pks = filter_batch(pks)
+            found += len(pks)
+            if pks and not self.options['dry_run']:
+                #The candidate filter is applied again, rows that changed meanwhile are skipped
+                deleted += delete(candidates.filter(pk__in=pks))
+                self.stdout.write(f"Deleted {deleted} {label} so far...")
+                if self.options['sleep']:
+                    time.sleep(self.options['sleep'])
+
+        if self.options['dry_run']:
+            self.stdout.write(f"{found} {label} would be deleted.")
+        else:
+            self.stdout.write(f"Deleted {deleted} {label}.")
+
+    def _delete_rows(self, rows):
+        deleted, _ = rows.delete()
+        return deleted
+
+    def _purge_chat_sessions(self, sessions):
+        session_ids = soft_delete_sessions(sessions)
+        for session_id in session_ids:
+            purge_session(session_id)
+        return len(session_ids)
+
+    def _unused_bodies(self, digests):
+        used = set(ChatMessage.objects.filter(body_id__in=digests).values_list('body_id', flat=True))
+        return [digest for digest in digests if digest not in used]
+
+    def _delete_unused_bodies(self, bodies):
+        #Checked again in the DELETE itself, in case a new message picked up a body meanwhile
+        digests = list(bodies.values_list('digest', flat=True))
+        deleted, _ = (
+            bodies.exclude(digest__in=ChatMessage.objects.filter(body_id__in=digests).values('body_id'))
+            .delete()
+        )
+        return deleted
@@ -0,0 +1,116 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from base.ai_service import get_ai_service, SUBJECT_KEYWORDS
+from base.models import ChatMessage, MessageBody, Quiz
+from base.quiz import build_quiz
+
+
+class Command(BaseCommand):
+    help = 'Precompute practice quizzes from recent chat history for all users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Only mine exchanges from the last N days')
+        parser.add_argument('--batch-size', type=int, default=200, help='Users loaded per batch')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--max-questions', type=int, default=10, help='Questions per quiz')
+        parser.add_argument('--min-exchanges', type=int, default=2, help='Exchanges needed before a subject gets a quiz')
+
+    def handle(self, *args, **options):
+        ai_service = get_ai_service()
+        subjects = [subject for subject, _ in SUBJECT_KEYWORDS] + ['general']
+        suggestions = {subject: list(ai_service.get_study_suggestions(subject)) for subject in subjects}
+        since = timezone.now() - timedelta(days=options['days'])
+
+        created = 0
+        last_user_id = 0
+        #spawn: workers only run build_quiz on plain data and never inherit DB connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+            while True:
+                user_ids = list(
+                    User.objects.filter(id__gt=last_user_id)
+                    .order_by('id')
+                    .values_list('id', flat=True)[:options['batch_size']]
+                )
+                if not user_ids:
+                    break
+                last_user_id = user_ids[-1]
+
+                jobs = self._collect_jobs(user_ids, since, suggestions, ai_service, options)
+                quizzes = [quiz for quiz in pool.map(build_quiz, jobs, chunksize=16) if quiz]
+                self._save(quizzes)
+
+                created += len(quizzes)
+                self.stdout.write(f"Built {created} quizzes, up to user id {last_user_id}...")
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully generated {created} quizzes."))
+
+    def _collect_jobs(self, user_ids, since, suggestions, ai_service, options):
+        """Pair each question with its answer and group them per user and subject"""
+        built_up_to = {
+            (row['user_id'], row['subject']): row['last']
+            for row in Quiz.objects.filter(user_id__in=user_ids)
+            .values('user_id', 'subject')
+            .annotate(last=Max('source_last_message_id'))
+        }
+
+        rows = (
+            ChatMessage.objects.filter(
+                session__user_id__in=user_ids, session__deleted_at__isnull=True, timestamp__gte=since,
+            )
+            .order_by('session_id', 'timestamp', 'id')
+            .values('id', 'session__user_id', 'session_id', 'message_type', 'subject', 'content', 'body_id')
+        )
+
+        grouped = {}
+        pending = None
+        for row in rows.iterator(chunk_size=2000):
+            content = row['content'] or (MessageBody.text_for(row['body_id']) if row['body_id'] else '')
+            if row['message_type'] == 'user':
+                pending = (row, content)
+                continue
+            if pending is None or pending[0]['session_id'] != row['session_id']:
+                continue
+
+            question_row, question = pending
+            pending = None
+            subject = question_row['subject'] or ai_service.classify_subject(question)
+            key = (row['session__user_id'], subject)
+            group = grouped.setdefault(key, {'exchanges': [], 'last_message_id': 0})
+            group['exchanges'].append((question, content))
+            group['last_message_id'] = max(group['last_message_id'], row['id'])
+
+        jobs = []
+        for (user_id, subject), group in grouped.items():
+            if len(group['exchanges']) < options['min_exchanges']:
+                continue
+            if group['last_message_id'] <= built_up_to.get((user_id, subject), 0):
+                continue        #nothing new since the last quiz
+            jobs.append({
+                'user_id': user_id,
+                'subject': subject,
+                'exchanges': group['exchanges'],
+                'suggestions': suggestions,
+                'max_questions': options['max_questions'],
+                'last_message_id': group['last_message_id'],
+            })
+        return jobs
+
+    def _save(self, quizzes):
+        """Replace each user's quiz for a subject with the freshly built one"""
+        if not quizzes:
+            return
+        with transaction.atomic():
+            for quiz in quizzes:
+                Quiz.objects.filter(user_id=quiz['user_id'], subject=quiz['subject']).delete()
+            Quiz.objects.bulk_create([
+                Quiz(question_count=len(quiz['questions']), **quiz) for quiz in quizzes
+            ])
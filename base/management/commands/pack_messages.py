@@ -0,0 +1,54 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Length
+
+from base.models import ChatMessage, MessageBody
+
+
+class Command(BaseCommand):
+    help = 'Move long inline message contents of existing rows into compressed MessageBody storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Messages per transaction')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        min_length = settings.MESSAGE_BODY_MIN_LENGTH
+        if not min_length:
+            raise CommandError("MESSAGE_BODY_MIN_LENGTH is 0, message packing is disabled.")
+
+        candidates = (
+            ChatMessage.objects.filter(body__isnull=True)
+            .annotate(content_length=Length('content'))
+            .filter(content_length__gte=min_length)
+            .order_by('id')
+        )
+
+        packed = 0
+        last_id = 0
+        while True:
+            rows = list(candidates.filter(id__gt=last_id).values_list('id', 'content')[:options['batch_size']])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            digests = MessageBody.intern_all([content for _, content in rows])
+            by_digest = defaultdict(list)
+            for (message_id, _), digest in zip(rows, digests):
+                by_digest[digest].append(message_id)
+
+            with transaction.atomic():
+                #One UPDATE per distinct body, template answers collapse to a handful
+                for digest, ids in by_digest.items():
+                    ChatMessage.objects.filter(id__in=ids).update(body_id=digest, content='')
+
+            packed += len(rows)
+            self.stdout.write(f"Packed {packed} messages so far...")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully packed {packed} messages."))
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from base.deletion import purge_session
+from base.models import ChatSession
+
+
+class Command(BaseCommand):
+    help = 'Remove the rows of soft-deleted chat sessions in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.CHAT_DELETE_BATCH_SIZE,
+            help='Messages removed per transaction',
+        )
+        parser.add_argument('--sleep', type=float, default=0.05, help='Seconds to pause between sessions')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be removed')
+
+    def handle(self, *args, **options):
+        deleted = ChatSession.objects.filter(deleted_at__isnull=False).order_by('id')
+
+        if options['dry_run']:
+            counts = deleted.aggregate(sessions=Count('id', distinct=True), messages=Count('messages'))
+            self.stdout.write(f"{counts['sessions']} deleted sessions with {counts['messages']} messages would be purged.")
+            return
+
+        total_sessions = total_messages = 0
+        last_id = 0
+        while True:
+            #One session at a time, each purged in batches of short transactions
+            session_id = deleted.filter(id__gt=last_id).values_list('id', flat=True).first()
+            if session_id is None:
+                break
+            last_id = session_id
+
+            total_messages += purge_session(session_id, options['batch_size'])
+            total_sessions += 1
+            if total_sessions % 20 == 0:
+                self.stdout.write(f"Purged {total_sessions} sessions ({total_messages} messages) so far...")
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully purged {total_sessions} sessions and {total_messages} messages."
+            )
+        )
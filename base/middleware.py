@@ -1,17 +1,96 @@
-from django.utils.deprecation import MiddlewareMixin
+import logging
+import math
+import re
+import time
+import uuid
 
-class ThemeMiddleware(MiddlewareMixin):
-    """Middleware to handle theme preferences"""
+from django.conf import settings
+from django.core.signals import request_finished
+from django.http import JsonResponse
+
+from .log import request_id
+from .ratelimit import TokenBucketLimiter, parse_rate
+
+
+access_logger = logging.getLogger('base.access')
+
+#Ids we accept from a proxy's X-Request-ID header
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def _clear_request_id(**kwargs):
+    request_id.set('-')
+
+
+#Cleared once the response is closed, not when the middleware returns: Django
+#logs 4xx/5xx responses (django.request) after the middleware chain is done
+request_finished.connect(_clear_request_id, dispatch_uid='base.middleware.clear_request_id')
+
+
+class RequestIDMiddleware:
+    """Gives each request an id (the proxy's X-Request-ID or a new one) that
+    every log record of the request carries, and logs one access line per request.
+    Slow and failed requests are logged as warnings so sampling never drops them."""
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.slow_seconds = settings.LOG_SLOW_REQUEST_MS / 1000
 
     def __call__(self, request):
-        #Set default theme if not set
-        if 'theme' not in request.session:
-            request.session['theme'] = 'light'
-
+        incoming = request.META.get('HTTP_X_REQUEST_ID', '')
+        rid = incoming if REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        request_id.set(rid)
+        started = time.perf_counter()
         response = self.get_response(request)
+        duration = time.perf_counter() - started
+        response['X-Request-ID'] = rid
+        slow_or_failed = duration > self.slow_seconds or response.status_code >= 500
+        access_logger.log(
+            logging.WARNING if slow_or_failed else logging.INFO,
+            "%s %s %s", request.method, request.path, response.status_code,
+            extra={'status': response.status_code, 'duration_ms': round(duration * 1000, 1)},
+        )
         return response
-    
-    
+
+
+class RateLimitMiddleware:
+    """Token-bucket rate limiting for the URL names listed in settings.RATELIMITS.
+    Each request takes a token from the user's bucket and the client IP's bucket,
+    each with its own limit."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limits = {
+            name: {scope: parse_rate(rate) for scope, rate in rates.items()}
+            for name, rates in settings.RATELIMITS.items()
+        }
+        self.limiter = TokenBucketLimiter(settings.RATELIMIT_CACHE)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        limits = self.limits.get(url_name)
+        if limits is None or not settings.RATELIMIT_ENABLED:
+            return None
+
+        buckets = []
+        if 'ip' in limits:
+            buckets.append((f"rl:{url_name}:ip:{self._client_ip(request)}", *limits['ip']))
+        if 'user' in limits and request.user.is_authenticated:
+            buckets.append((f"rl:{url_name}:user:{request.user.pk}", *limits['user']))
+        if not buckets:
+            return None
+
+        retry_after = self.limiter.consume(buckets)
+        if retry_after:
+            response = JsonResponse({'error': 'Too many requests, please slow down.'}, status=429)
+            response['Retry-After'] = str(math.ceil(retry_after))
+            return response
+        return None
+
+    def _client_ip(self, request):
+        #Behind a proxy the last X-Forwarded-For entry is the one the proxy added
+        value = request.META.get(settings.RATELIMIT_IP_HEADER) or request.META.get('REMOTE_ADDR', '')
+        return value.split(',')[-1].strip()
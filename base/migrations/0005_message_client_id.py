@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_message_body'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(fields=('session', 'client_id'), name='unique_session_client_id'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='chatsession',
+            constraint=models.UniqueConstraint(fields=('user', 'client_id'), name='unique_user_client_id'),
+        ),
+    ]
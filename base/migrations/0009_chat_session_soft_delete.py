@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0008_quiz'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,7 +1,22 @@
-from django.db import models
+import hashlib
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import models, router
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .fields import PackedTextField
 
 # Create your models here.
+class ActiveChatSessionManager(models.Manager):
+    """Hides sessions the user deleted; their rows are purged later in batches"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class ChatSession(models.Model):
     """model to store chat sessions for each user 
     Each session represents a conversation between a user and a chatbot."""
@@ -9,13 +24,86 @@ class ChatSession(models.Model):
     title = models.CharField(max_length=200, default="New Chat")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    is_archived = models.BooleanField(default=False)      #messages moved to ChatArchive
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)    #soft-deleted, see deletion.py
+    #client_id of the message that started the session, so its retries find it
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+
+    #The default manager sees every row (admin, dumpdata, cascades); views use `active`
+    objects = models.Manager()
+    active = ActiveChatSessionManager()
 
     class Meta:
         ordering = ['-updated_at']      #Latest first
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], name='unique_user_client_id'),
+        ]
+        indexes = [
+            models.Index(fields=['-updated_at'], name='chatsession_updated_idx'),
+            models.Index(fields=['created_at'], name='chatsession_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.created_at.strftime('%Y-%m-%d')}"
     
+class MessageBody(models.Model):
+    """Content-addressed, zlib-compressed storage for long message texts.
+    Identical texts (like the template AI answers) are stored only once."""
+    digest = models.CharField(max_length=64, primary_key=True)      #sha256 of the text
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)     #bumped by intern_all, collect_garbage spares recent ones
+
+    def __str__(self):
+        return self.digest
+
+    @property
+    def text(self):
+        return zlib.decompress(bytes(self.data)).decode('utf-8')
+
+    @staticmethod
+    def digest_for(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def intern_all(cls, texts, using=None):
+        """Store the given texts (once each) and return their digests in order"""
+        digests = [cls.digest_for(text) for text in texts]
+        unique = dict(zip(digests, texts))
+        manager = cls.objects.db_manager(using)
+        #Marks existing bodies as in use first, so collect_garbage doesn't delete one
+        #before the message that references it is saved
+        now = timezone.now()
+        manager.filter(digest__in=unique).update(last_used_at=now)
+        manager.bulk_create(
+            [
+                cls(digest=digest, data=zlib.compress(text.encode('utf-8'), 9), last_used_at=now)
+                for digest, text in unique.items()
+            ],
+            ignore_conflicts=True,
+        )
+        return digests
+
+    @classmethod
+    def texts_for(cls, digests):
+        """{digest: text} for several digests, in one query"""
+        return {body.digest: body.text for body in cls.objects.filter(digest__in=set(digests))}
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def text_for(digest):
+        """Decompressed text for a digest, cached per process (bodies never change)"""
+        return MessageBody.objects.only('data').get(digest=digest).text
+
+
+class ChatMessageQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        #The bodies go to the database the messages go to
+        ChatMessage.pack_all(objs, using=self._db or router.db_for_write(self.model))
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class ChatMessage(models.Model):
     """model to store chat messages for each chat session"""
     MESSAGE_TYPES = (
@@ -24,14 +112,58 @@ class ChatMessage(models.Model):
     )
     session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages')
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES)
-    content = models.TextField()
+    content = PackedTextField(blank=True)       #empty when the text lives in `body`
+    body = models.ForeignKey(MessageBody, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
     timestamp = models.DateTimeField(auto_now_add=True)
+    subject = models.CharField(max_length=20, blank=True)      #AIService.classify_subject, user messages only
+    #Idempotency key sent by the client; the AI reply gets the same key + REPLY_SUFFIX
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+
+    objects = ChatMessageQuerySet.as_manager()
+
+    REPLY_SUFFIX = ':reply'
 
     class Meta:
-        ordering = ['timestamp']        #oldest first for conversation flow
+        ordering = ['timestamp', 'id']        #oldest first for conversation flow, batches share a timestamp
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'client_id'], name='unique_session_client_id'),
+        ]
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='chatmessage_timestamp_idx'),
+        ]
 
     def __str__(self):
         return f"{self.message_type}: {self.content[:50]}..."
+
+    @classmethod
+    def pack_all(cls, messages, using=None):
+        """Move long contents into shared MessageBody rows before saving"""
+        min_length = settings.MESSAGE_BODY_MIN_LENGTH
+        long_messages = []
+        for message in messages:
+            if min_length and len(message.content) >= min_length:
+                long_messages.append(message)
+            else:
+                message.body_id = None
+        if long_messages:
+            digests = MessageBody.intern_all([message.content for message in long_messages], using=using)
+            for message, digest in zip(long_messages, digests):
+                message.body_id = digest
+
+    def save(self, *args, **kwargs):
+        self.pack_all([self], using=kwargs.get('using') or router.db_for_write(type(self), instance=self))
+        super().save(*args, **kwargs)
+
+class ChatArchive(models.Model):
+    """Cold storage for the messages of an inactive chat session.
+    The messages are kept as gzip-compressed JSON and restored on demand."""
+    session = models.OneToOneField(ChatSession, on_delete=models.CASCADE, related_name='archive')
+    message_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of {self.session_id} ({self.message_count} messages)"
     
 class StudyTopic(models.Model):
     """Model to story topics/subjects for each user"""
@@ -56,11 +188,63 @@ class UserProfile(models.Model):
     favourite_subjects = models.ManyToManyField(StudyTopic, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='userprofile_created_idx'),
+            models.Index(fields=['grade_level'], name='userprofile_grade_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
-    
 
 
+class StudyProgress(models.Model):
+    """Daily study activity rollup per user and subject.
+    Kept up to date as messages are saved, so dashboards never scan ChatMessage."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='study_progress')
+    day = models.DateField()
+    subject = models.CharField(max_length=20)
+    message_count = models.PositiveIntegerField(default=0)     #questions asked
+    session_count = models.PositiveIntegerField(default=0)     #sessions with a question on this subject that day
+    active_seconds = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        ordering = ['-day', 'subject']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'subject'], name='unique_user_day_subject'),
+        ]
 
-    
+    def __str__(self):
+        return f"{self.user.username} - {self.day} - {self.subject}"
+
+
+class Quiz(models.Model):
+    """Practice quiz precomputed from a user's chat history by `manage.py generate_quizzes`.
+    Questions are stored inline so a quiz page is a single primary key lookup."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quizzes')
+    subject = models.CharField(max_length=20)
+    title = models.CharField(max_length=200)
+    questions = models.JSONField(default=list)
+    question_count = models.PositiveIntegerField(default=0)
+    source_last_message_id = models.BigIntegerField(default=0)     #newest ChatMessage the quiz was built from
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='quiz_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.user.username})"
+
+
+class JobCheckpoint(models.Model):
+    """Last processed position of a resumable batch job (e.g. backfills)"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
@@ -0,0 +1,175 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .archive import unpack_messages
+from .models import ChatArchive, ChatMessage, MessageBody, StudyProgress
+
+
+#Questions closer together than this count as one continuous study stretch
+ACTIVE_GAP = timedelta(minutes=10)
+#Time credited for a question that starts a new stretch
+MIN_ACTIVE_SECONDS = 60
+
+
+def _apply_activity(row, timestamp, new_session):
+    """Add one question at `timestamp` to a StudyProgress row (in memory)"""
+    row.message_count += 1
+    if new_session:
+        row.session_count += 1
+
+    gap = timestamp - row.last_activity_at if row.last_activity_at else None
+    if gap is not None and timedelta(0) <= gap <= ACTIVE_GAP:
+        row.active_seconds += int(gap.total_seconds())
+    else:
+        row.active_seconds += MIN_ACTIVE_SECONDS
+
+    if row.last_activity_at is None or timestamp > row.last_activity_at:
+        row.last_activity_at = timestamp
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def record_study_activity(user, chat_session, user_messages):
+    """Update the rollups for newly saved user messages (with `subject` set).
+    Each (day, subject) row is read and written once, however many messages it gets."""
+    groups = {}
+    for msg in sorted(user_messages, key=lambda msg: (msg.timestamp, msg.id)):
+        groups.setdefault((timezone.localdate(msg.timestamp), msg.subject), []).append(msg)
+
+    #Subjects of the session asked about earlier that day, before these messages
+    asked_before = set()
+    first_id = min(msg.id for msg in user_messages) if user_messages else None
+    for day in {day for day, _ in groups}:
+        asked_before.update(
+            (day, subject) for subject in ChatMessage.objects.filter(
+                session=chat_session,
+                message_type='user',
+                subject__in={subject for group_day, subject in groups if group_day == day},
+                timestamp__gte=_day_start(day),
+                id__lt=first_id,
+            ).values_list('subject', flat=True).distinct()
+        )
+
+    with transaction.atomic():
+        #Always locked in the same order, so concurrent requests can't deadlock
+        for (day, subject), messages in sorted(groups.items()):
+            row, _ = StudyProgress.objects.select_for_update().get_or_create(
+                user=user, day=day, subject=subject,
+            )
+            for i, msg in enumerate(messages):
+                _apply_activity(row, msg.timestamp, new_session=i == 0 and (day, subject) not in asked_before)
+            row.save()
+
+
+def _user_questions(user_id):
+    """All questions a user asked, live and archived, oldest first"""
+    questions = [
+        dict(row, live=True)
+        for row in ChatMessage.objects.filter(session__user_id=user_id, message_type='user')
+        .values('id', 'session_id', 'timestamp', 'subject', 'content', 'body_id')
+        .iterator(chunk_size=2000)
+    ]
+    for archive in ChatArchive.objects.filter(session__user_id=user_id).only('session_id', 'data'):
+        for msg in unpack_messages(archive.data):
+            if msg['message_type'] == 'user':
+                questions.append({
+                    'id': msg['id'],
+                    'session_id': archive.session_id,
+                    'timestamp': parse_datetime(msg['timestamp']),
+                    'subject': msg.get('subject', ''),
+                    'content': msg['content'],
+                    'body_id': None,
+                    'live': False,
+                })
+    questions.sort(key=lambda q: (q['timestamp'], q['id']))
+    return questions
+
+
+def rebuild_user_progress(user_id, classify_subject):
+    """Recompute the rollups of one user from their messages.
+    Safe to re-run: the user's rows are replaced, not added to.
+
+    Only days before today are rebuilt. Today's rows are the ones
+    record_study_activity is updating while this runs, and replacing them
+    could drop an update made between reading the messages and writing.
+    Returns the number of messages processed."""
+    today = timezone.localdate()
+    rollups = {}
+    seen_sessions = set()
+    unclassified = {}
+    questions = _user_questions(user_id)
+    for question in questions:
+        subject = question['subject']
+        if not subject:
+            #Messages saved before subjects were recorded
+            content = question['content'] or MessageBody.text_for(question['body_id'])
+            subject = classify_subject(content)
+            if question['live']:
+                unclassified.setdefault(subject, []).append(question['id'])
+
+        day = timezone.localdate(question['timestamp'])
+        if day >= today:
+            continue
+        key = (day, subject)
+        if key not in rollups:
+            rollups[key] = StudyProgress(user_id=user_id, day=day, subject=subject)
+        new_session = (day, subject, question['session_id']) not in seen_sessions
+        seen_sessions.add((day, subject, question['session_id']))
+        _apply_activity(rollups[key], question['timestamp'], new_session)
+
+    with transaction.atomic():
+        for subject, ids in unclassified.items():
+            ChatMessage.objects.filter(id__in=ids).update(subject=subject)
+        StudyProgress.objects.filter(user_id=user_id, day__lt=today).delete()
+        StudyProgress.objects.bulk_create(rollups.values(), batch_size=500)
+
+    return len(questions)
+
+
+def progress_summary(user, days=30):
+    """Dashboard data for the last `days` days, read from the rollups only"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = StudyProgress.objects.filter(user=user, day__gte=since)
+
+    by_subject = (
+        rows.values('subject')
+        .annotate(
+            messages=Sum('message_count'),
+            sessions=Sum('session_count'),
+            active_seconds=Sum('active_seconds'),
+        )
+        .order_by('-messages')
+    )
+    by_day = (
+        rows.values('day')
+        .annotate(messages=Sum('message_count'), active_seconds=Sum('active_seconds'))
+        .order_by('day')
+    )
+
+    return {
+        'since': since.isoformat(),
+        'days': days,
+        'subjects': [
+            {
+                'subject': row['subject'],
+                'messages': row['messages'],
+                'sessions': row['sessions'],
+                'active_minutes': round(row['active_seconds'] / 60),
+            }
+            for row in by_subject
+        ],
+        'daily': [
+            {
+                'day': row['day'].isoformat(),
+                'messages': row['messages'],
+                'active_minutes': round(row['active_seconds'] / 60),
+            }
+            for row in by_day
+        ],
+    }
@@ -0,0 +1,85 @@
+"""Quiz building for the offline `generate_quizzes` pipeline.
+
+Everything here is plain Python on plain data so it can run in worker
+processes without Django or a database connection."""
+
+import random
+import re
+
+
+SUBJECT_TITLES = {
+    'math': 'Mathematics',
+    'science': 'Science',
+    'history': 'History',
+    'english': 'English',
+    'general': 'General Study Skills',
+}
+
+#Markdown list items like "1. **Break down the problems** into smaller steps"
+_KEY_POINT = re.compile(r'^\s*(?:\d+\.|[-*])\s*(.+)$')
+
+
+def _key_points(answer, limit=3):
+    """Pull the main list items out of an AI answer"""
+    points = []
+    for line in answer.splitlines():
+        match = _KEY_POINT.match(line)
+        if match:
+            points.append(match.group(1).replace('**', '').strip())
+        if len(points) >= limit:
+            break
+    return points
+
+
+def build_quiz(job):
+    """Build one quiz from a user's question/answer exchanges on one subject.
+
+    `job` is a dict with user_id, subject, exchanges ([(question, answer)]),
+    suggestions ({subject: [tips]}), max_questions and last_message_id.
+    Returns the data for a Quiz row, or None if there is too little material."""
+    subject = job['subject']
+    rng = random.Random(f"{job['user_id']}:{subject}:{job['last_message_id']}")
+    questions = []
+
+    #Recall questions from the student's own questions, newest first
+    seen = set()
+    for question, answer in reversed(job['exchanges']):
+        key = question.strip().lower()
+        points = _key_points(answer)
+        if key in seen or not points:
+            continue
+        seen.add(key)
+        questions.append({
+            'kind': 'recall',
+            'question': f'You asked: "{question.strip()}". What were the key points of the answer?',
+            'answer': points,
+        })
+        if len(questions) >= job['max_questions'] - 1:
+            break
+
+    if not questions:
+        return None
+
+    #One multiple choice question on study strategy for the subject
+    own_tips = job['suggestions'].get(subject, [])
+    other_tips = [
+        tip for other, tips in job['suggestions'].items() if other != subject for tip in tips
+    ]
+    if own_tips and len(other_tips) >= 3:
+        correct = rng.choice(own_tips)
+        options = rng.sample(other_tips, 3) + [correct]
+        rng.shuffle(options)
+        questions.append({
+            'kind': 'choice',
+            'question': f'Which of these is a recommended way to study {SUBJECT_TITLES.get(subject, subject)}?',
+            'options': options,
+            'answer': [correct],
+        })
+
+    return {
+        'user_id': job['user_id'],
+        'subject': subject,
+        'title': f"{SUBJECT_TITLES.get(subject, subject.title())} practice quiz",
+        'questions': questions,
+        'source_last_message_id': job['last_message_id'],
+    }
@@ -0,0 +1,86 @@
+import math
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+
+#Token bucket update for every key in KEYS, run atomically inside Redis so
+#all gunicorn workers share the same buckets. ARGV: now, then the capacity and
+#refill rate (tokens per second) of each key. Returns the longest wait in ms, 0 when allowed.
+_TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local ttl = math.ceil(capacity / rate) + 1
+    local state = redis.call('HMGET', key, 't', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens + 1e-9 >= 1 then
+        tokens = tokens - 1
+    else
+        wait = math.max(wait, math.ceil((1 - tokens) / rate * 1000))
+    end
+    redis.call('HSET', key, 't', string.format('%.9f', tokens), 'ts', string.format('%.6f', now))
+    redis.call('EXPIRE', key, ttl)
+end
+return wait
+"""
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Parse '20/m' into (capacity, tokens per second)"""
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / _PERIODS[period.strip().lower()[0]]
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets kept in a Django cache.
+
+    With the Redis cache backend each check is one atomic script call shared
+    by all workers. Any other backend falls back to get/set under a
+    process-local lock, which is only exact within a single process."""
+
+    def __init__(self, cache_alias='default'):
+        self.cache = caches[cache_alias]
+        self._script = None
+        self._lock = threading.Lock()
+
+    def consume(self, buckets):
+        """Take one token from each bucket, given as (key, capacity, tokens per second).
+        Returns 0 if allowed, otherwise seconds to wait before retrying."""
+        now = time.time()
+        if isinstance(self.cache, RedisCache):
+            buckets = [(self.cache.make_and_validate_key(key), capacity, rate) for key, capacity, rate in buckets]
+            return self._redis_consume(buckets, now) / 1000
+        return self._local_consume(buckets, now)
+
+    def _redis_consume(self, buckets, now):
+        if self._script is None:
+            client = self.cache._cache.get_client(write=True)
+            self._script = client.register_script(_TOKEN_BUCKET_LUA)
+        args = [now]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        return int(self._script(keys=[key for key, _, _ in buckets], args=args))
+
+    def _local_consume(self, buckets, now):
+        wait = 0
+        with self._lock:
+            for key, capacity, rate in buckets:
+                ttl = math.ceil(capacity / rate) + 1
+                tokens, ts = self.cache.get(key, (capacity, now))
+                tokens = min(capacity, tokens + max(0, now - ts) * rate)
+                if tokens + 1e-9 >= 1:
+                    tokens -= 1
+                else:
+                    wait = max(wait, (1 - tokens) / rate)
+                self.cache.set(key, (tokens, now), ttl)
+        return wait
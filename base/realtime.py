@@ -0,0 +1,311 @@
+"""Live updates of open chats over WebSockets.
+
+Every tab showing a chat holds a WebSocket to /ws/chat/<session_id>/
+(served by `chat_socket` in the ASGI app). The views publish each new
+message, with the session's current title, to the session's channel once
+their transaction commits, and the broker fans it out to the sockets
+subscribed to that channel. The broker is set by REALTIME_BROKER: the
+in-process one only reaches sockets of the same process, the Redis one
+reaches every process and node."""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+from contextlib import asynccontextmanager
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.http import parse_cookie
+from django.http.request import split_domain_port, validate_host
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ChatMessage, ChatSession
+
+
+logger = logging.getLogger(__name__)
+
+CHAT_SOCKET_PATH = re.compile(r'^/ws/chat/(?P<session_id>\d+)/$')
+
+#Close codes the client acts on: don't reconnect, and reconnect to catch up
+CLOSE_FORBIDDEN = 4403
+CLOSE_TOO_SLOW = 4008
+
+
+def session_channel(session_id):
+    return f"session:{session_id}"
+
+
+def message_payload(msg):
+    """A chat message as sent to the browser"""
+    return {
+        'id': msg.id,
+        'type': msg.message_type,
+        'content': msg.content,
+        'timestamp': timezone.localtime(msg.timestamp).strftime('%H:%M'),
+    }
+
+
+def messages_event(chat_session, messages, client_id=None):
+    """JSON text of a `messages` event; client_id lets the tab that sent them skip it"""
+    return json.dumps({
+        'type': 'messages',
+        'session_id': chat_session.id,
+        'title': chat_session.title,
+        'client_id': client_id,
+        'messages': [message_payload(msg) for msg in messages],
+    })
+
+
+def publish_messages(chat_session, messages, client_id=None):
+    """Push new messages (and the session title) to every open tab of the session
+    once the current transaction commits. Failures are logged, not raised."""
+    if not settings.REALTIME_ENABLED:
+        return
+    event = messages_event(chat_session, messages, client_id)
+    channel = session_channel(chat_session.id)
+    transaction.on_commit(lambda: get_broker().publish(channel, event), robust=True)
+
+
+class Subscription:
+    """Events of one channel for one socket, queued on the socket's event loop"""
+
+    def __init__(self, channel, max_queue):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            #The socket can't keep up; None tells it to close, the client reconnects and catches up
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """Fans events out to the subscribers in this process. Enough when one
+    process serves the pages and the sockets, and the stand-in in tests"""
+
+    def __init__(self, options):
+        self.max_queue = options.get('MAX_QUEUE', 100)
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscription = Subscription(channel, self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscriptions = self._subscribers[channel]
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, message):
+        """Send `message` (a str) to the channel's subscribers, from any thread"""
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.put, message)
+
+
+class RedisBroker(InProcessBroker):
+    """Publishes through Redis pub/sub, for sockets held by other processes or nodes.
+
+    Each process listens with one pattern subscription to PREFIX* and fans the
+    events out to its own subscribers, so there is no per-socket Redis state."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.url = options['URL']
+        self.prefix = options.get('PREFIX', 'chat:')
+        self._client = None
+        self._listener = None
+
+    def publish(self, channel, message):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(self.prefix + channel, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        #Started by the first socket, and again by the next one if Redis went away
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        async with super().subscribe(channel) as subscription:
+            yield subscription
+
+    async def _listen(self):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.psubscribe(self.prefix + '*')
+            async for message in pubsub.listen():
+                if message['type'] == 'pmessage':
+                    channel = message['channel'].decode()[len(self.prefix):]
+                    self._deliver(channel, message['data'].decode())
+        except Exception:
+            logger.exception("Redis listener for chat events stopped")
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+def load_broker(name=None):
+    """Create the broker configured as `name` in settings.REALTIME_BROKERS"""
+    name = name or settings.REALTIME_BROKER
+    try:
+        config = dict(settings.REALTIME_BROKERS[name])
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"REALTIME_BROKER {name!r} is not one of {', '.join(settings.REALTIME_BROKERS)}"
+        )
+    broker_class = import_string(config.pop('BACKEND'))
+    return broker_class(config)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Shared per-process broker, created on first use"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = load_broker()
+    return _broker
+
+
+def _database(func):
+    """sync_to_async for ORM calls made outside Django's request cycle,
+    closing stale connections around them the way requests do"""
+    def wrapper(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper)
+
+
+def _allowed_origin(headers):
+    """Cookies go with cross-site WebSocket requests too, so the Origin must be this site"""
+    host = headers.get(b'host', b'').decode('latin1')
+    domain, _ = split_domain_port(host)
+    if not domain or not validate_host(domain, settings.ALLOWED_HOSTS):
+        return False
+    origin = headers.get(b'origin')
+    if origin is None:
+        return True     #not a browser
+    origin = origin.decode('latin1')
+    return urlsplit(origin).netloc == host or origin in settings.CSRF_TRUSTED_ORIGINS
+
+
+@_database
+def _authorized_session(headers, session_id):
+    """The logged-in user's chat session `session_id`, or None"""
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin1'))
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    user = get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+    if not user.is_authenticated:
+        return None
+    return ChatSession.active.filter(id=session_id, user=user).first()
+
+
+@_database
+def _missed_event(chat_session, after):
+    """Messages saved after id `after`, for a socket that reconnects; a reload
+    event when more were missed than MAX_CATCH_UP"""
+    limit = settings.REALTIME_MAX_CATCH_UP
+    missed = list(
+        ChatMessage.objects.filter(session_id=chat_session.id, id__gt=after)
+        .select_related('body')
+        .order_by('id')[:limit + 1]
+    )
+    if len(missed) > limit:
+        return json.dumps({'type': 'reload'})
+    return messages_event(chat_session, missed) if missed else None
+
+
+async def chat_socket(scope, receive, send):
+    """ASGI app for /ws/chat/<session_id>/[?after=<message id>]: sends the
+    session's events as JSON text frames until the browser goes away.
+    Frames from the browser (keep-alive pings) are ignored."""
+    if (await receive())['type'] != 'websocket.connect':
+        return
+
+    match = CHAT_SOCKET_PATH.match(scope['path'])
+    headers = dict(scope['headers'])
+    chat_session = None
+    if match and _allowed_origin(headers):
+        chat_session = await _authorized_session(headers, int(match['session_id']))
+    if chat_session is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    after = parse_qs(scope.get('query_string', b'').decode('latin1')).get('after', [''])[0]
+    async with get_broker().subscribe(session_channel(chat_session.id)) as subscription:
+        await send({'type': 'websocket.accept'})
+        #Subscribed first, so nothing saved meanwhile is missed (the client skips repeats)
+        if after.isdigit():
+            missed = await _missed_event(chat_session, int(after))
+            if missed:
+                await send({'type': 'websocket.send', 'text': missed})
+
+        receiving = asyncio.ensure_future(receive())
+        getting = asyncio.ensure_future(subscription.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait({receiving, getting}, return_when=asyncio.FIRST_COMPLETED)
+                if receiving in done:
+                    if receiving.result()['type'] == 'websocket.disconnect':
+                        return
+                    receiving = asyncio.ensure_future(receive())
+                if getting in done:
+                    event = getting.result()
+                    if event is None:
+                        await send({'type': 'websocket.close', 'code': CLOSE_TOO_SLOW})
+                        return
+                    await send({'type': 'websocket.send', 'text': event})
+                    getting = asyncio.ensure_future(subscription.get())
+        finally:
+            receiving.cancel()
+            getting.cancel()
+
+
+async def websocket_application(scope, receive, send):
+    """Routes WebSocket connections; the only endpoint is the chat socket"""
+    if settings.REALTIME_ENABLED and CHAT_SOCKET_PATH.match(scope['path']):
+        await chat_socket(scope, receive, send)
+    else:
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4404})
@@ -0,0 +1,55 @@
+from django.conf import settings
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+#Our own bundles (from STATICFILES_DIRS); admin and third party files ship minified already
+MINIFY_PREFIXES = ('css/', 'js/')
+
+
+def _minifier(path):
+    """rcssmin/rjsmin for the file type, or None if not installed"""
+    try:
+        if path.endswith('.css'):
+            from rcssmin import cssmin
+            return cssmin
+        if path.endswith('.js'):
+            from rjsmin import jsmin
+            return jsmin
+    except ImportError:
+        pass
+    return None
+
+
+class MinifiedManifestStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """WhiteNoise's hashed + gzip/Brotli storage that also minifies our CSS and JS
+    during collectstatic, before the files are hashed and compressed.
+
+    Until collectstatic has run (runserver, CI on a fresh checkout) {% static %}
+    links the unhashed names instead of failing on the missing manifest."""
+
+    #Files added since the last collectstatic also get their plain name
+    manifest_strict = False
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run and getattr(settings, 'STATIC_MINIFY', True):
+            self._minify(paths)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def _minify(self, paths):
+        for path in paths:
+            if not path.startswith(MINIFY_PREFIXES) or '.min.' in path:
+                continue
+            minify = _minifier(path)
+            if minify is None:
+                continue
+            with open(self.path(path), encoding='utf-8') as f:
+                source = f.read()
+            with open(self.path(path), 'w', encoding='utf-8') as f:
+                f.write(minify(source))
+            #Hash (and compress) the minified copy, not the original in STATICFILES_DIRS
+            paths[path] = (self, path)
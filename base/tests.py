@@ -1,3 +1,566 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from types import MappingProxyType
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import ai_service
+from .ai_batching import MicroBatcher
+from .archive import archive_sessions, restore_session
+from .db_router import _use_replica
+from .log import request_id
+from .models import ChatArchive, ChatMessage, ChatSession, MessageBody, StudyProgress
+from .progress import rebuild_user_progress, record_study_activity
+from .ratelimit import TokenBucketLimiter, parse_rate
+from .realtime import CLOSE_FORBIDDEN, InProcessBroker, publish_messages, websocket_application
+
+
+#The limiter's buckets live in the cache and would carry over between tests
+NO_RATELIMIT = override_settings(RATELIMIT_ENABLED=False)
+
+
+class RestoreSessionRoutingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.session = ChatSession.objects.create(user=self.user, title="Archived")
+        ChatMessage.objects.create(session=self.session, message_type='user', content="What is a cell?")
+        ChatMessage.objects.create(session=self.session, message_type='ai', content="A cell is " + "x" * 500)
+        archive_sessions([self.session.id], timezone.now() + timedelta(days=1))
+
+    def test_restore_while_replica_reads_are_active(self):
+        #There is no 'replica' alias in tests, so any query routed there fails
+        token = _use_replica.set(True)
+        try:
+            with mock.patch('base.db_router.replica_configured', return_value=True):
+                messages = restore_session(self.session)
+        finally:
+            _use_replica.reset(token)
+
+        self.assertEqual([msg.message_type for msg in messages], ['user', 'ai'])
+        self.assertTrue(messages[1].content.startswith("A cell is "))
+        self.assertFalse(ChatArchive.objects.filter(session=self.session).exists())
+        self.assertFalse(ChatSession.objects.get(id=self.session.id).is_archived)
+
+
+class PackedMessageQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.client.force_login(self.user)
+
+    def _session_with(self, count):
+        session = ChatSession.objects.create(user=self.user, title=f"{count} messages")
+        for i in range(count):
+            ChatMessage.objects.create(session=session, message_type='ai', content=f"answer {i} " + "x" * 300)
+        return session
+
+    def _page_queries(self, session):
+        MessageBody.text_for.cache_clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/chat/{session.id}/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_chat_page_loads_packed_bodies_with_the_messages(self):
+        few, many = self._session_with(2), self._session_with(9)
+        self.assertTrue(ChatMessage.objects.filter(session=many, body__isnull=False).exists())
+        self.assertEqual(self._page_queries(few), self._page_queries(many))
+
+
+@NO_RATELIMIT
+class RetryAfterFailureTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.client.force_login(self.user)
+        self.session = ChatSession.objects.create(user=self.user, title="Retries")
+
+    def _send(self, client_id):
+        return self.client.post('/chat/send/', {
+            'session_id': self.session.id, 'message': "What is osmosis?", 'client_id': client_id,
+        }, content_type='application/json')
+
+    def _questions(self):
+        return ChatMessage.objects.filter(session=self.session, message_type='user')
+
+    def test_retry_after_the_backend_failed_is_answered(self):
+        with mock.patch('base.ai_service.AIService.get_study_response', side_effect=RuntimeError("backend down")):
+            self.assertEqual(self._send('key-1').status_code, 500)
+        self.assertFalse(self._questions().exists())
+
+        response = self._send('key-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._questions().count(), 1)
+        self.assertTrue(ChatMessage.objects.filter(session=self.session, client_id='key-1' + ChatMessage.REPLY_SUFFIX).exists())
+
+    def test_retry_of_an_abandoned_question_is_answered(self):
+        #Left behind by a worker that died before answering
+        question = ChatMessage.objects.create(session=self.session, message_type='user', content="What is osmosis?", client_id='key-2')
+        self.assertEqual(self._send('key-2').status_code, 409)
+
+        ChatMessage.objects.filter(id=question.id).update(timestamp=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self._send('key-2').status_code, 200)
+        self.assertEqual(self._questions().count(), 1)
+
+
+@NO_RATELIMIT
+class SendBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.client.force_login(self.user)
+
+    def _send(self, data):
+        return self.client.post('/chat/send-batch/', data, content_type='application/json')
+
+    def test_body_must_be_an_object(self):
+        for body in (["What is a cell?"], "What is a cell?", 3):
+            self.assertEqual(self._send(body).status_code, 400)
+
+    def test_invalid_session_id(self):
+        for session_id in ("abc", "1.5", -1, [1], {'id': 1}):
+            response = self._send({'session_id': session_id, 'questions': ["What is a cell?"]})
+            self.assertEqual(response.status_code, 400, session_id)
+        self.assertFalse(ChatSession.objects.exists())
+
+    def test_archived_session_is_restored_before_new_questions(self):
+        session = ChatSession.objects.create(user=self.user, title="Archived")
+        ChatMessage.objects.create(session=session, message_type='user', content="What is a cell?")
+        ChatMessage.objects.create(session=session, message_type='ai', content="A cell is " + "x" * 500)
+        archive_sessions([session.id], timezone.now() + timedelta(days=1))
+
+        response = self._send({'session_id': session.id, 'questions': ["What is DNA?"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ChatArchive.objects.filter(session=session).exists())
+        contents = [msg.content for msg in ChatMessage.objects.filter(session=session).order_by('id')]
+        self.assertEqual(contents[0], "What is a cell?")
+        self.assertEqual(contents[2], "What is DNA?")
+
+
+@NO_RATELIMIT
+class SharedAIServiceTests(TestCase):
+    def test_requests_share_one_service(self):
+        self.client.force_login(User.objects.create_user('student'))
+        with mock.patch('base.ai_service._service', None):
+            service = ai_service.get_ai_service()
+            with mock.patch.object(service, 'get_study_suggestions', wraps=service.get_study_suggestions) as suggestions:
+                for subject in ('math', 'history'):
+                    self.assertEqual(self.client.get('/api/study-tips/', {'subject': subject}).status_code, 200)
+            self.assertEqual(suggestions.call_count, 2)
+            self.assertIs(ai_service.get_ai_service(), service)
+
+    def test_lookup_tables_are_read_only(self):
+        for table in (ai_service.STUDY_RESPONSES, ai_service.STUDY_SUGGESTIONS):
+            self.assertIsInstance(table, MappingProxyType)
+            with self.assertRaises(TypeError):
+                table['general'] = None
+        for suggestions in ai_service.STUDY_SUGGESTIONS.values():
+            self.assertIsInstance(suggestions, tuple)
+        self.assertIsInstance(ai_service.SUBJECT_KEYWORDS, tuple)
+        self.assertIsInstance(ai_service.FALLBACK_RESPONSES, tuple)
+        self.assertIsInstance(ai_service.DEFAULT_SUGGESTIONS, tuple)
+
+
+class SoftDeletedSessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.client.force_login(self.user)
+        self.session = ChatSession.objects.create(user=self.user, title="Deleted", deleted_at=timezone.now())
+
+    def test_hidden_from_the_user(self):
+        self.assertFalse(ChatSession.active.filter(id=self.session.id).exists())
+        self.assertEqual(self.client.get(f'/chat/{self.session.id}/').status_code, 404)
+
+    def test_visible_to_the_admin(self):
+        self.assertTrue(ChatSession.objects.filter(id=self.session.id).exists())
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.get(f'/admin/base/chatsession/{self.session.id}/change/')
+        self.assertEqual(response.status_code, 200)
+
+
+@NO_RATELIMIT
+class FirstMessageRetryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.client.force_login(self.user)
+
+    def _send(self, client_id):
+        return self.client.post('/chat/send/', {'message': "What is osmosis?", 'client_id': client_id}, content_type='application/json')
+
+    def test_retries_of_the_first_message_share_one_session(self):
+        #A concurrent first attempt has started the session but not saved its message yet
+        started = ChatSession.objects.create(user=self.user, client_id='key-1')
+
+        for _ in range(2):
+            response = self._send('key-1')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['session_id'], started.id)
+        self.assertEqual(ChatSession.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(ChatMessage.objects.filter(session=started).count(), 2)
+
+
+class MessageBodyCollectionTests(TestCase):
+    def setUp(self):
+        session = ChatSession.objects.create(title="Bodies")
+        self.text = "A cell is " + "x" * 500
+        ChatMessage.objects.create(session=session, message_type='ai', content=self.text)
+        ChatMessage.objects.filter(session=session).delete()
+        MessageBody.objects.update(last_used_at=timezone.now() - timedelta(days=2))
+
+    def _collect(self):
+        call_command('collect_garbage', sleep=0, stdout=StringIO())
+
+    def test_unused_body_is_collected(self):
+        self._collect()
+        self.assertFalse(MessageBody.objects.exists())
+
+    def test_body_interned_again_is_kept(self):
+        #Interned for a message that is about to be saved
+        digest, = MessageBody.intern_all([self.text])
+        self._collect()
+        self.assertTrue(MessageBody.objects.filter(digest=digest).exists())
+
+
+class AdminListTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin')
+        self.client.force_login(self.admin)
+        for count in (0, 3):
+            session = ChatSession.objects.create(user=self.admin, title=f"{count} messages")
+            for i in range(count):
+                ChatMessage.objects.create(session=session, message_type='user', content=f"question {i}")
+
+    def test_message_counts_are_counted_per_listed_session(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/base/chatsession/', {'o': '5'})
+        self.assertEqual(response.status_code, 200)
+        listed = [query['sql'] for query in queries if 'base_chatmessage' in query['sql']]
+        self.assertEqual(len(listed), 1)
+        self.assertNotIn('GROUP BY', listed[0])
+        self.assertEqual([session.message_count for session in response.context['cl'].result_list], [0, 3])
+
+    def test_profile_list(self):
+        self.assertEqual(self.client.get('/admin/base/userprofile/').status_code, 200)
+
+
+class LiveUpdatesSettingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.client.force_login(self.user)
+        self.session = ChatSession.objects.create(user=self.user, title="Live")
+
+    def test_off_by_default(self):
+        response = self.client.get(f'/chat/{self.session.id}/')
+        self.assertNotContains(response, 'data-live-updates')
+        with mock.patch('base.realtime.get_broker') as get_broker, self.captureOnCommitCallbacks(execute=True):
+            publish_messages(self.session, [])
+        get_broker.assert_not_called()
+
+    @override_settings(REALTIME_ENABLED=True)
+    def test_enabled(self):
+        response = self.client.get(f'/chat/{self.session.id}/')
+        self.assertContains(response, 'data-live-updates="true"')
+        with mock.patch('base.realtime.get_broker') as get_broker, self.captureOnCommitCallbacks(execute=True):
+            publish_messages(self.session, [])
+        get_broker.return_value.publish.assert_called_once()
+
+    @override_settings(REALTIME_ENABLED=True, RATELIMIT_ENABLED=False)
+    def test_unanswered_question_is_not_pushed(self):
+        with (
+            mock.patch('base.ai_service.AIService.get_study_response', side_effect=RuntimeError("backend down")),
+            mock.patch('base.realtime.get_broker') as get_broker,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            response = self.client.post('/chat/send/', {'session_id': self.session.id, 'message': "What is osmosis?"}, content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+        get_broker.assert_not_called()
+
+
+class RecordingBackend:
+    """generate_batch that records batch sizes and can be held up"""
+
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def generate_batch(self, prompts):
+        self.release.wait(5)
+        self.batches.append(len(prompts))
+        return [prompt.upper() for prompt in prompts]
+
+
+class MicroBatcherTests(TestCase):
+    def setUp(self):
+        self.backend = RecordingBackend()
+        #A wait long enough to notice if a lone request sat it out
+        self.batcher = MicroBatcher(self.backend, max_batch_size=8, max_wait_ms=2000)
+
+    def test_lone_request_is_sent_at_once(self):
+        started = time.perf_counter()
+        self.assertEqual(self.batcher.submit("a").result(timeout=5), "A")
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(self.backend.batches, [1])
+
+    def test_requests_waiting_together_are_batched(self):
+        self.batcher.max_wait = 0.05
+        self.backend.release.clear()
+        first = self.batcher.submit("a")
+        while not self.batcher._queue.empty():
+            time.sleep(0.001)
+        #Queued while the first one is being generated
+        waiting = [self.batcher.submit(prompt) for prompt in "bcd"]
+        self.backend.release.set()
+        self.assertEqual([future.result(timeout=5) for future in [first, *waiting]], ["A", "B", "C", "D"])
+        self.assertEqual(self.backend.batches, [1, 3])
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.limiter = TokenBucketLimiter('default')
+        self.bucket = ('rl:test:user:1', *parse_rate('2/m'))
+
+    def _consume(self, now):
+        with mock.patch('base.ratelimit.time.time', return_value=now):
+            return self.limiter.consume([self.bucket])
+
+    def test_tokens_refill_over_time(self):
+        self.assertEqual(self._consume(1000), 0)
+        self.assertEqual(self._consume(1000), 0)
+        self.assertAlmostEqual(self._consume(1000), 30)
+        #Half a token back after 15 seconds
+        self.assertAlmostEqual(self._consume(1015), 15)
+        self.assertEqual(self._consume(1030), 0)
+
+    def test_every_bucket_must_have_a_token(self):
+        full = ('rl:test:ip:1', *parse_rate('100/m'))
+        with mock.patch('base.ratelimit.time.time', return_value=1000):
+            for _ in range(2):
+                self.limiter.consume([full, self.bucket])
+            self.assertGreater(self.limiter.consume([full, self.bucket]), 0)
+
+
+@override_settings(RATELIMITS={'get_study_tips': {'user': '4/m', 'ip': '100/m'}})
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def _tips(self, username):
+        self.client.force_login(User.objects.get_or_create(username=username)[0])
+        return self.client.get('/api/study-tips/', REMOTE_ADDR='10.0.0.1')
+
+    def test_over_the_user_limit(self):
+        with mock.patch('base.ratelimit.time.time', return_value=1000):
+            statuses = [self._tips('student').status_code for _ in range(5)]
+            response = self._tips('student')
+        self.assertEqual(statuses, [200] * 4 + [429])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '15')
+
+    def test_users_behind_one_address_have_their_own_limits(self):
+        with mock.patch('base.ratelimit.time.time', return_value=1000):
+            statuses = {self._tips(f'student{i}').status_code for i in range(6) for _ in range(4)}
+        self.assertEqual(statuses, {200})
+
+
+class RequestIDCapture(logging.Handler):
+    """Keeps the message and the request id current when each record was logged"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.getMessage(), request_id.get()))
+
+
+@NO_RATELIMIT
+class RequestIDLoggingTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('student'))
+        self.capture = RequestIDCapture()
+        logging.getLogger('django.request').addHandler(self.capture)
+        self.addCleanup(logging.getLogger('django.request').removeHandler, self.capture)
+
+    def test_error_record_carries_the_request_id(self):
+        with mock.patch('base.ai_service.AIService.get_study_response', side_effect=RuntimeError("backend down")):
+            response = self.client.post('/chat/send/', {'message': "What is osmosis?"}, content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+        self.assertIn(("Internal Server Error: /chat/send/", response['X-Request-ID']), self.capture.records)
+        #Cleared once the request is over
+        self.assertEqual(request_id.get(), '-')
+
+
+@NO_RATELIMIT
+class StudyProgressTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.client.force_login(self.user)
+        self.yesterday = timezone.localtime() - timedelta(days=1)
+
+    def _ask(self, session, subject, hour, minute):
+        """A question saved yesterday at hour:minute and recorded like the views do"""
+        msg = ChatMessage.objects.create(session=session, message_type='user', content=f"{subject} question", subject=subject)
+        timestamp = self.yesterday.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        ChatMessage.objects.filter(id=msg.id).update(timestamp=timestamp)
+        msg.timestamp = timestamp
+        record_study_activity(self.user, session, [msg])
+
+    def _rows(self):
+        return {
+            row.subject: (row.message_count, row.session_count, row.active_seconds)
+            for row in StudyProgress.objects.filter(user=self.user, day=self.yesterday.date())
+        }
+
+    def _study_yesterday(self):
+        first, second = (ChatSession.objects.create(user=self.user) for _ in range(2))
+        self._ask(first, 'math', 10, 0)
+        self._ask(first, 'math', 10, 5)      #same stretch: the 5 minutes count
+        self._ask(second, 'math', 11, 0)     #new stretch and a second session
+        self._ask(second, 'history', 11, 1)
+
+    def test_rollup_math(self):
+        self._study_yesterday()
+        self.assertEqual(self._rows(), {'math': (3, 2, 60 + 300 + 60), 'history': (1, 1, 60)})
+
+    def test_rebuild_matches_the_live_rollups_and_leaves_today_alone(self):
+        self._study_yesterday()
+        live = self._rows()
+        today = StudyProgress.objects.create(user=self.user, day=timezone.localdate(), subject='math', message_count=7)
+
+        StudyProgress.objects.filter(day__lt=timezone.localdate()).update(message_count=0)
+        rebuild_user_progress(self.user.id, ai_service.classify_subject)
+        self.assertEqual(self._rows(), live)
+        today.refresh_from_db()
+        self.assertEqual(today.message_count, 7)
+
+    def test_batch_updates_each_row_once(self):
+        session = ChatSession.objects.create(user=self.user)
+
+        def queries(count):
+            data = {'session_id': session.id, 'questions': ["solve this math problem"] * count}
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.post('/chat/send-batch/', data, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            return len(captured)
+
+        queries(1)      #titles the session and creates the row
+        self.assertEqual(queries(2), queries(10))
+        row = StudyProgress.objects.get(user=self.user, day=timezone.localdate(), subject='math')
+        self.assertEqual((row.message_count, row.session_count), (13, 1))
+
+    def test_dashboard(self):
+        self._study_yesterday()
+        response = self.client.get('/api/progress/', {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        progress = response.json()['progress']
+        self.assertEqual(progress['days'], 7)
+        self.assertEqual(progress['subjects'][0], {'subject': 'math', 'messages': 3, 'sessions': 2, 'active_minutes': 7})
+        self.assertEqual(progress['daily'], [{'day': self.yesterday.date().isoformat(), 'messages': 4, 'active_minutes': 8}])
+        self.assertEqual(self.client.get('/api/progress/', {'days': 'week'}).status_code, 400)
+
+
+class FakeSocket:
+    """Drives an ASGI WebSocket app the way a browser tab and the server would"""
+
+    def __init__(self, app, path, cookies, origin='http://testserver'):
+        headers = [(b'host', b'testserver'), (b'cookie', cookies.encode())]
+        if origin:
+            headers.append((b'origin', origin.encode()))
+        scope = {'type': 'websocket', 'path': path.split('?')[0], 'query_string': path.partition('?')[2].encode(), 'headers': headers}
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.incoming.put_nowait({'type': 'websocket.connect'})
+        self.task = asyncio.ensure_future(app(scope, self.incoming.get, self.outgoing.put))
+
+    async def frame(self):
+        return await asyncio.wait_for(self.outgoing.get(), 5)
+
+    async def event(self):
+        frame = await self.frame()
+        self.assert_type(frame, 'websocket.send')
+        return json.loads(frame['text'])
+
+    @staticmethod
+    def assert_type(frame, expected):
+        if frame['type'] != expected:
+            raise AssertionError(f"expected {expected}, got {frame}")
+
+    async def close(self):
+        self.incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+@NO_RATELIMIT
+@override_settings(REALTIME_ENABLED=True)
+class ChatSocketTests(TransactionTestCase):
+    """chat_socket with the in-process broker; a TransactionTestCase since the
+    socket reads the database from another thread"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.client.force_login(self.user)
+        self.cookies = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        self.session = ChatSession.objects.create(user=self.user, title="Live")
+        broker = mock.patch('base.realtime._broker', InProcessBroker({}))
+        broker.start()
+        self.addCleanup(broker.stop)
+
+    def _open(self, path=None, origin='http://testserver'):
+        return FakeSocket(websocket_application, path or f'/ws/chat/{self.session.id}/', self.cookies, origin)
+
+    def test_new_messages_reach_every_open_tab(self):
+        async def scenario():
+            tabs = [self._open(), self._open()]
+            for tab in tabs:
+                tab.assert_type(await tab.frame(), 'websocket.accept')
+
+            send = sync_to_async(self.client.post)
+            response = await send('/chat/send/', {'session_id': self.session.id, 'message': "What is osmosis?", 'client_id': 'key-1'}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+            for tab in tabs:
+                event = await tab.event()
+                self.assertEqual([msg['type'] for msg in event['messages']], ['user', 'ai'])
+                self.assertEqual(event['client_id'], 'key-1')
+                self.assertEqual(event['title'], "What is osmosis?")
+                await tab.close()
+
+        asyncio.run(scenario())
+
+    def test_reconnecting_tab_catches_up(self):
+        seen = ChatMessage.objects.create(session=self.session, message_type='user', content="What is a cell?")
+        missed = ChatMessage.objects.create(session=self.session, message_type='ai', content="A cell is " + "x" * 500)
+
+        async def scenario():
+            tab = self._open(f'/ws/chat/{self.session.id}/?after={seen.id}')
+            tab.assert_type(await tab.frame(), 'websocket.accept')
+            event = await tab.event()
+            self.assertEqual([msg['id'] for msg in event['messages']], [missed.id])
+            self.assertTrue(event['messages'][0]['content'].startswith("A cell is "))
+            await tab.close()
+
+        asyncio.run(scenario())
+
+    def test_foreign_origin_and_other_users_chats_are_refused(self):
+        other = ChatSession.objects.create(user=User.objects.create_user('other'))
+
+        async def scenario():
+            for tab in (self._open(origin='https://evil.example'), self._open(f'/ws/chat/{other.id}/')):
+                frame = await tab.frame()
+                tab.assert_type(frame, 'websocket.close')
+                self.assertEqual(frame['code'], CLOSE_FORBIDDEN)
+
+        asyncio.run(scenario())
@@ -8,18 +8,25 @@ urlpatterns = [
 
     #User authentication and registration
     path('signup/', views.signup_view, name='signup'),
+    path('account/delete/', views.delete_account, name='delete_account'),
 
     #Chat functionality
     path('chat/', views.new_chat, name='new_chat'),
     path('chat/<int:session_id>/', views.chat_view, name='chat_view'),
     path('chat/send/', views.send_message, name='send_message'),
+    path('chat/send-batch/', views.send_batch, name='send_batch'),
     path('chat/delete/<int:session_id>/', views.delete_session, name='delete_session'),
     path('chat/history/', views.chat_history, name='chat_history'),
+    path('chat/history/delete/', views.delete_history, name='delete_history'),
 
     #Study features
     path('toggle-theme/', views.toggle_theme, name='toggle_theme'),
     path('topics/', views.study_topics_view, name='study_topics'),
+    path('quizzes/', views.quiz_list, name='quiz_list'),
+    path('quizzes/<int:quiz_id>/', views.quiz_view, name='quiz_view'),
     path('api/study-tips/', views.get_study_tips, name='get_study_tips'), 
+    path('api/progress/', views.get_study_progress, name='get_study_progress'),
+    path('api/ai-metrics/', views.get_ai_metrics, name='get_ai_metrics'),
 ]
 
 
@@ -1,18 +1,31 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, authenticate
+from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from datetime import timedelta
 import json
 
-from .models import ChatSession, ChatMessage, StudyTopic
-from .ai_service import AIService
+from .models import ChatSession, ChatMessage, StudyTopic, Quiz
+from .db_router import read_from_replica, pin_to_primary
+from .progress import record_study_activity, progress_summary
+
+#The AI service, archive, deletion and realtime modules are imported by the views
+#that use them, so loading the URLconf stays cheap for requests that don't need them
 
 # Create your views here.
 
+#Leaves room for ChatMessage.REPLY_SUFFIX within the 64 character column
+MAX_CLIENT_ID_LENGTH = 48
+
+@read_from_replica
 def home(request):
     """Home page view - shows welcome page and study topics """
     study_topics = StudyTopic.objects.filter(is_active=True)
@@ -25,57 +38,157 @@ def home(request):
 
 
 @login_required
+@read_from_replica
 def chat_view(request, session_id=None):
-    """Main chat interface view"""
-    #Get or create chat session
+    """Main chat interface view
+    Without a session_id it shows an empty chat; the session is saved with its first message"""
+    from .archive import restore_session
+    chat_session = None
+    messages = []
     if session_id:
-        chat_session = get_object_or_404(ChatSession, id=session_id, user=request.user)
-    else:
-        #Create new chat session 
-        chat_session = ChatSession.objects.create(
-            user=request.user,
-            title="New Study Session"
-        )
-        return redirect('chat_view', session_id=chat_session.id)
-    
-    #Get all messages for this session
-    messages = chat_session.messages.all()
+        chat_session = get_object_or_404(ChatSession.active, id=session_id, user=request.user)
+
+        if chat_session.is_archived:
+            #Old session opened from history, bring its messages back first
+            messages = restore_session(chat_session)
+            pin_to_primary(request)
+        else:
+            messages = chat_session.messages.select_related('body')
 
     #Get user's recent sessions for sidebar
-    recent_sessions = ChatSession.objects.filter(user=request.user)[:10]
+    recent_sessions = ChatSession.active.filter(user=request.user)[:10]
 
     context = {
         'current_theme': request.session.get('theme', 'light'),
         'chat_session': chat_session,
         'messages': messages,
         'recent_sessions': recent_sessions,
+        'realtime_enabled': settings.REALTIME_ENABLED,
     }
 
     return render(request, 'base/chat.html', context)
 
 
+def _message_json(msg):
+    """Serialize a chat message for the JSON API"""
+    return {
+        'id': msg.id,
+        'content': msg.content,
+        'timestamp': msg.timestamp.strftime('%H:%M')
+    }
+
+
+def _message_pair_response(user_msg, ai_msg, chat_session, duplicate=False):
+    """JSON payload returned for a user message and its AI reply"""
+    return JsonResponse({
+        'success': True,
+        'duplicate': duplicate,
+        'user_message': _message_json(user_msg),
+        'ai_message': _message_json(ai_msg),
+        'session_id': chat_session.id,
+        'session_title': chat_session.title
+    })
+
+
+def _get_or_start_session(request, session_id, client_id=None):
+    """The user's chat session, or a new one for a chat opened without one"""
+    from .archive import restore_session
+    if session_id is not None:
+        chat_session = get_object_or_404(ChatSession.active, id=session_id, user=request.user)
+        if chat_session.is_archived:
+            #New messages go after the archived ones, so bring those back first
+            restore_session(chat_session)
+        return chat_session
+
+    if client_id:
+        #Retries of the first message (even concurrent ones) get the session its first attempt started
+        chat_session, _ = ChatSession.objects.get_or_create(
+            user=request.user, client_id=client_id, defaults={'title': "New Study Session"},
+        )
+        if chat_session.deleted_at is not None:
+            raise Http404("Chat session was deleted")
+        return chat_session
+
+    return ChatSession.objects.create(user=request.user, title="New Study Session")
+
+
+def _valid_session_id(session_id):
+    """session_id from a JSON body: None for a new chat, or a positive int"""
+    return session_id is None or (type(session_id) is int and session_id > 0) or (
+        isinstance(session_id, str) and session_id.isdigit()
+    )
+
+
+def _replay_message(chat_session, client_id):
+    """Response for a retried message, or None if it should be answered as a new one"""
+    attempts = (
+        chat_session.messages.filter(client_id__in=[client_id, client_id + ChatMessage.REPLY_SUFFIX])
+        .select_related('body')
+    )
+    stored = {msg.client_id: msg for msg in attempts}
+    if client_id not in stored:
+        return None
+
+    ai_msg = stored.get(client_id + ChatMessage.REPLY_SUFFIX)
+    if ai_msg is None:
+        question = stored[client_id]
+        if question.timestamp < timezone.now() - timedelta(seconds=settings.CHAT_REPLY_TIMEOUT):
+            #The first attempt died without answering (e.g. its worker was killed), answer it again
+            ChatMessage.objects.filter(id=question.id).delete()
+            return None
+        #First attempt is still generating the answer
+        return JsonResponse({'error': 'Message is still being processed'}, status=409)
+    return _message_pair_response(stored[client_id], ai_msg, chat_session, duplicate=True)
+
+
 @csrf_exempt
 @login_required
 def send_message(request):
-    """Handle AJAX request to send message to chatbot"""
+    """Handle AJAX request to send message to chatbot
+    An optional client_id makes retries return the stored answer instead of a new one"""
+    from .ai_service import get_ai_service
+    from .realtime import publish_messages
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
+            if not isinstance(data, dict):
+                return JsonResponse({'error': 'Expected a JSON object'}, status=400)
             session_id = data.get('session_id')
             user_message = data.get('message', '').strip()
+            client_id = data.get('client_id') or None
 
             if not user_message:
                 return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+            if client_id is not None and (not isinstance(client_id, str) or len(client_id) > MAX_CLIENT_ID_LENGTH):
+                return JsonResponse({'error': 'Invalid client_id'}, status=400)
+            if not _valid_session_id(session_id):
+                return JsonResponse({'error': 'Invalid session_id'}, status=400)
             
-            #Get chat session
-            chat_session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+            #Get chat session, a new chat is saved now with its first message
+            chat_session = _get_or_start_session(request, session_id, client_id)
+
+            #Retry of a message we already answered
+            if client_id:
+                replay = _replay_message(chat_session, client_id)
+                if replay is not None:
+                    return replay
+
+            ai_service = get_ai_service()
 
             #Save user message
-            user_msg = ChatMessage.objects.create(
-                session=chat_session,
-                message_type='user',
-                content=user_message,
-            )
+            try:
+                with transaction.atomic():
+                    user_msg = ChatMessage.objects.create(
+                        session=chat_session,
+                        message_type='user',
+                        content=user_message,
+                        subject=ai_service.classify_subject(user_message),
+                        client_id=client_id,
+                    )
+            except IntegrityError:
+                #A concurrent retry with the same client_id won the race
+                replay = _replay_message(chat_session, client_id)
+                return replay or JsonResponse({'error': 'Message is still being processed'}, status=409)
 
             #Update session title if it's the first message
             if chat_session.messages.count() == 1:
@@ -84,39 +197,36 @@ def send_message(request):
                 chat_session.title = title
                 chat_session.save()
 
-            #Get AI response
-            ai_service = AIService()
-
-            #Get conversation context (last few messages)
-            recent_messages = chat_session.messages.filter(message_type='user').order_by('-timestamp')[:3]
-            context = " ".join([msg.content for msg in reversed(recent_messages)])
-
-            ai_response = ai_service.get_study_response(user_message, context)
-
-            #Save AI response
-            ai_msg = ChatMessage.objects.create(
-                session=chat_session,
-                message_type='ai',
-                content=ai_response
-            ) 
+            try:
+                #Get conversation context (last few messages)
+                recent_messages = chat_session.messages.filter(message_type='user').select_related('body').order_by('-timestamp')[:3]
+                context = " ".join([msg.content for msg in reversed(recent_messages)])
+
+                ai_response = ai_service.get_study_response(user_message, context)
+
+                #Save AI response
+                ai_msg = ChatMessage.objects.create(
+                    session=chat_session,
+                    message_type='ai',
+                    content=ai_response,
+                    client_id=client_id + ChatMessage.REPLY_SUFFIX if client_id else None,
+                )
+            except Exception:
+                #Unanswered, so a retry with the same client_id must start over instead of getting 409s
+                user_msg.delete()
+                raise
             
             #Update session 
             chat_session.save()     #This updates the updated_at timestamp
+            #Other tabs showing this chat get the question with its answer, never an unanswered one
+            publish_messages(chat_session, [user_msg, ai_msg], client_id)
 
-            return JsonResponse({
-                'success': True,
-                'user_message': {
-                    'id': user_msg.id,
-                    'content': user_msg.content,
-                    'timestamp': user_msg.timestamp.strftime('%H:%M')
-            },
-            'ai_message': {
-                'id' : ai_msg.id,
-                'content': user_msg.content,
-                'timestamp': user_msg.timestamp.strftime('%H:%M')                
-            },
-            'session_title': chat_session.title
-        })
+            record_study_activity(request.user, chat_session, [user_msg])
+
+            #Read the next pages from the primary until the replica catches up
+            pin_to_primary(request)
+
+            return _message_pair_response(user_msg, ai_msg, chat_session)
 
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON data'}, status=400)
@@ -126,25 +236,95 @@ def send_message(request):
     return JsonResponse({'error': 'Invalid request method'}, status=405)        #405 Method Not Allowed url exists but http method used is not allowed for that url
             
 
+@csrf_exempt
+@login_required
+def send_batch(request):
+    """Handle a list of questions for one session in a single request
+    All questions are answered in one AIService call and saved with one bulk insert"""
+    from .ai_service import get_ai_service
+    from .realtime import publish_messages
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    if not _valid_session_id(data.get('session_id')):
+        return JsonResponse({'error': 'Invalid session_id'}, status=400)
+
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        return JsonResponse({'error': 'questions must be a non-empty list'}, status=400)
+    if len(questions) > settings.CHAT_BATCH_MAX_QUESTIONS:
+        return JsonResponse({'error': f'At most {settings.CHAT_BATCH_MAX_QUESTIONS} questions per batch'}, status=400)
+    questions = [q.strip() if isinstance(q, str) else '' for q in questions]
+    if not all(questions):
+        return JsonResponse({'error': 'Questions cannot be empty'}, status=400)
+
+    chat_session = _get_or_start_session(request, data.get('session_id'))
+    is_first_message = not chat_session.messages.exists()
+
+    #Context from the last few questions asked before this batch
+    recent_messages = chat_session.messages.filter(message_type='user').select_related('body').order_by('-timestamp')[:3]
+    context = " ".join([msg.content for msg in reversed(recent_messages)])
+
+    ai_service = get_ai_service()
+    answers = ai_service.get_study_responses(questions, context)
+
+    #Interleave question/answer pairs and insert them in one statement
+    new_messages = []
+    for question, answer in zip(questions, answers):
+        new_messages.append(ChatMessage(
+            session=chat_session,
+            message_type='user',
+            content=question,
+            subject=ai_service.classify_subject(question),
+        ))
+        new_messages.append(ChatMessage(session=chat_session, message_type='ai', content=answer))
+    with transaction.atomic():
+        ChatMessage.objects.bulk_create(new_messages)
+
+        if is_first_message:
+            first = questions[0]
+            chat_session.title = first[:50] + "..." if len(first) > 50 else first
+        chat_session.save()     #This updates the updated_at timestamp
+        publish_messages(chat_session, new_messages)
+
+    record_study_activity(request.user, chat_session, new_messages[::2])
+    pin_to_primary(request)
+
+    return JsonResponse({
+        'success': True,
+        'messages': [
+            {'user_message': _message_json(user_msg), 'ai_message': _message_json(ai_msg)}
+            for user_msg, ai_msg in zip(new_messages[::2], new_messages[1::2])
+        ],
+        'session_id': chat_session.id,
+        'session_title': chat_session.title
+    })
+
+
 @login_required
 def new_chat(request):
-    """Create a new chat session"""
-    new_session = ChatSession.objects.create(
-        user=request.user,
-        title="New Study Session",
-    )
-    return redirect('chat_view', session_id=new_session.id)
+    """Start a new chat (saved by send_message once the first message is sent)"""
+    return chat_view(request)
 
 @login_required
 def delete_session(request, session_id):
     """Delete a chat session"""
+    from .deletion import soft_delete_sessions, purge_inline
     if request.method == 'POST':
-        session = get_object_or_404(ChatSession, id=session_id, user=request.user)
-        session.delete()
+        get_object_or_404(ChatSession.active, id=session_id, user=request.user)
+        #Hidden right away, the rows go now or (big sessions) in purge_deleted_chats
+        purge_inline(soft_delete_sessions(ChatSession.active.filter(id=session_id)))
+        pin_to_primary(request)
         messages.success(request, 'Chat session deleted successfully!')
     
         #Redirect to most recent session or create a new one
-        latest_session = ChatSession.objects.filter(user=request.user).first()
+        latest_session = ChatSession.active.filter(user=request.user).first()
         if latest_session:
             return redirect('chat_view', session_id=latest_session.id)
         else:
@@ -152,6 +332,30 @@ def delete_session(request, session_id):
     
     return redirect('home')
 
+@login_required
+def delete_history(request):
+    """Delete all chat sessions of the user"""
+    from .deletion import soft_delete_sessions, purge_inline
+    if request.method == 'POST':
+        purge_inline(soft_delete_sessions(ChatSession.active.filter(user=request.user)))
+        pin_to_primary(request)
+        messages.success(request, 'Your chat history was deleted.')
+        return redirect('chat_history')
+
+    return redirect('home')
+
+@login_required
+def delete_account(request):
+    """Delete the user's account and everything stored for it"""
+    from .deletion import delete_user_account
+    if request.method == 'POST':
+        user = request.user
+        logout(request)
+        delete_user_account(user)
+        messages.success(request, 'Your account was deleted.')
+
+    return redirect('home')
+
 
 def signup_view(request):
     """User registration view"""
@@ -177,12 +381,14 @@ def signup_view(request):
     return render(request, 'registration/signup.html', {'form': form})   
            
 @login_required
+@read_from_replica
 def study_topics_view(request):
     """View for show all available study topics"""
+    from .ai_service import get_ai_service
     topics = StudyTopic.objects.filter(is_active=True)
 
     #Get study suggestions for each topic
-    ai_service = AIService()
+    ai_service = get_ai_service()
     topics_with_suggestions = []
 
     for topic in topics:
@@ -200,9 +406,10 @@ def study_topics_view(request):
     return render(request, 'base/study_topics.html', context)
 
 @login_required
+@read_from_replica
 def chat_history(request):
     """View to show user's chat history"""
-    sessions = ChatSession.objects.filter(user=request.user)
+    sessions = ChatSession.active.filter(user=request.user)
 
     #Add pagination
     paginator = Paginator(sessions, 10)     #10 sessions per page
@@ -238,10 +445,11 @@ def about_view(request):
 @login_required
 def get_study_tips(request):
     """API endpoint to get quick study tips for a given topic"""
+    from .ai_service import get_ai_service
     if request.method == 'GET':
         subject = request.GET.get('subject', 'general')
 
-        ai_service = AIService()
+        ai_service = get_ai_service()
         tips = ai_service.get_study_suggestions(subject)
 
         return JsonResponse({
@@ -253,6 +461,64 @@ def get_study_tips(request):
     return JsonResponse({ 'error':'Invalid request method'}, status=405)
 
 
+@staff_member_required
+def get_ai_metrics(request):
+    """API endpoint for staff with the AI batching metrics of the worker process that answers"""
+    from .ai_service import get_ai_service
+    ai_service = get_ai_service()
+    return JsonResponse({
+        'backend': settings.AI_BACKEND,
+        'batching': ai_service.batcher.metrics() if ai_service.batcher else None,
+        'success': True
+    })
+
+
+
+@login_required
+@read_from_replica
+def get_study_progress(request):
+    """API endpoint with the user's study progress, read from the daily rollups"""
+    if request.method == 'GET':
+        try:
+            days = min(max(int(request.GET.get('days', 30)), 1), 365)
+        except ValueError:
+            return JsonResponse({'error': 'days must be a number'}, status=400)
+
+        return JsonResponse({
+            'progress': progress_summary(request.user, days),
+            'success': True
+        })
+
+    return JsonResponse({ 'error':'Invalid request method'}, status=405)
+
+
+
+@login_required
+@read_from_replica
+def quiz_list(request):
+    """List the user's precomputed practice quizzes"""
+    quizzes = Quiz.objects.filter(user=request.user).defer('questions')
+
+    context = {
+        'current_theme': request.session.get('theme', 'light'),
+        'quizzes': quizzes,
+    }
+    return render(request, 'base/quiz_list.html', context)
+
+
+@login_required
+@read_from_replica
+def quiz_view(request, quiz_id):
+    """Show one practice quiz, a single primary key lookup"""
+    quiz = get_object_or_404(Quiz, id=quiz_id, user=request.user)
+
+    context = {
+        'current_theme': request.session.get('theme', 'light'),
+        'quiz': quiz,
+    }
+    return render(request, 'base/quiz.html', context)
+
+
 
 #Making dark theme 
 def toggle_theme(request):
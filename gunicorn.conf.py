@@ -0,0 +1,58 @@
+"""
+Gunicorn configuration for study_assistant.
+
+Picked up automatically by `gunicorn study_assistant.wsgi` from the project
+root. With preloading the Django app, URLconf, views and the AIService are
+loaded once in the master and shared copy-on-write by all workers.
+"""
+
+import gc
+import os
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+#AI micro-batching (base/ai_batching.py) only forms batches when a process has
+#several requests in flight, so it gets threaded workers; sync ones otherwise
+from study_assistant.settings import AI_BATCHING  # noqa: E402
+threads = int(os.getenv('GUNICORN_THREADS', 8 if AI_BATCHING['ENABLED'] else 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+
+def when_ready(server):
+    """Runs in the master once the app is loaded (before any worker forks)"""
+    if not preload_app:
+        return
+
+    from django.urls import get_resolver
+    from base.ai_service import get_ai_service
+
+    #Import every view module now instead of on each worker's first request,
+    #including the modules the views import lazily
+    get_resolver().url_patterns
+    import base.archive, base.deletion, base.realtime  # noqa: E401,F401
+    get_ai_service()
+
+    #Move everything loaded so far out of the GC's reach, so collections in
+    #the workers don't write to (and un-share) these pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Runs in each worker right after the fork"""
+    if not preload_app:
+        return
+
+    #Never share a database socket the master may have opened
+    from django.db import connections
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    """Runs in each worker once the app is loaded, before it accepts requests"""
+    from base.ai_service import get_ai_service
+
+    #Per worker and not in the master: a local model's threads don't survive a fork
+    get_ai_service().warm_up()
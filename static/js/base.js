@@ -0,0 +1,82 @@
+// Get CSRF token for Django
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+// Initialize theme
+function initTheme() {
+    const currentTheme = document.documentElement.dataset.currentTheme;
+    const themeIcon = document.getElementById('theme-icon');
+    const themeText = document.getElementById('theme-text');
+
+    if (currentTheme === 'dark') {
+        themeIcon.className = 'theme-icon fas fa-sun';
+        themeText.textContent = 'Light Mode';
+    } else {
+        themeIcon.className = 'theme-icon fas fa-moon';
+        themeText.textContent = 'Dark Mode';
+    }
+}
+
+// Toggle theme function
+async function toggleTheme() {
+    const currentTheme = document.documentElement.getAttribute('data-theme');
+    const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
+    const themeIcon = document.getElementById('theme-icon');
+    const themeText = document.getElementById('theme-text');
+
+    // Show loading state
+    themeIcon.className = 'theme-icon fas fa-spinner loading';
+    themeText.textContent = 'Switching...';
+
+    try {
+        const response = await fetch('/toggle-theme/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            body: JSON.stringify({theme: newTheme})
+        });
+
+        const data = await response.json();
+
+        if (data.status === 'success') {
+            // Update theme
+            document.documentElement.setAttribute('data-theme', newTheme);
+
+            // Update button
+            if (newTheme === 'dark') {
+                themeIcon.className = 'theme-icon fas fa-sun';
+                themeText.textContent = 'Light Mode';
+            } else {
+                themeIcon.className = 'theme-icon fas fa-moon';
+                themeText.textContent = 'Dark Mode';
+            }
+
+            // Add smooth transition effect
+            document.body.style.transition = 'all 0.3s ease';
+
+        } else {
+            throw new Error('Theme toggle failed');
+        }
+    } catch (error) {
+        console.error('Error toggling theme:', error);
+        // Reset button on error
+        initTheme();
+    }
+}
+
+// Initialize theme on page load
+document.addEventListener('DOMContentLoaded', initTheme);
@@ -0,0 +1,307 @@
+// Chat functionality
+const chatMessages = document.getElementById('chatMessages');
+const messageInput = document.getElementById('messageInput');
+const chatForm = document.getElementById('chatForm');
+const sendBtn = document.getElementById('sendBtn');
+const typingIndicator = document.getElementById('typingIndicator');
+
+// Auto-scroll to bottom
+function scrollToBottom() {
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+// Escape text for innerHTML, like the template's |linebreaks does
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+// Ids of the messages on the page, so pushed messages are never shown twice
+const renderedIds = new Set(
+    Array.from(chatMessages.querySelectorAll('[data-message-id]'), el => Number(el.dataset.messageId))
+);
+let lastMessageId = Math.max(0, ...renderedIds);
+
+function markRendered(element, messageId) {
+    element.dataset.messageId = messageId;
+    renderedIds.add(messageId);
+    lastMessageId = Math.max(lastMessageId, messageId);
+}
+
+// Add message to chat, timestamp is a Date or an already formatted "HH:MM"
+function addMessage(content, type, timestamp = null, messageId = null) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `chat-message ${type}-message`;
+
+    const timeString = typeof timestamp === 'string' ? timestamp : (timestamp || new Date()).toLocaleTimeString('en-US', { 
+        hour: '2-digit', 
+        minute: '2-digit',
+        hour12: false 
+    });
+
+    messageDiv.innerHTML = `
+        <div class="message-bubble">
+            ${escapeHtml(content).replace(/\n/g, '<br>')}
+        </div>
+        <div class="timestamp">${timeString}</div>
+    `;
+
+    chatMessages.appendChild(messageDiv);
+    if (messageId !== null) {
+        markRendered(messageDiv, messageId);
+    }
+    scrollToBottom();
+    return messageDiv;
+}
+
+// Header and sidebar title of this chat
+function setTitle(title) {
+    document.getElementById('chatTitle').textContent = title;
+    const sidebarTitle = document.querySelector(`.session-item[data-session-id="${sessionId}"] .session-title`);
+    if (sidebarTitle) {
+        sidebarTitle.textContent = title.length > 30 ? title.slice(0, 29) + '…' : title;
+    }
+}
+
+// Show/hide typing indicator
+function showTyping() {
+    typingIndicator.style.display = 'block';
+    scrollToBottom();
+}
+
+function hideTyping() {
+    typingIndicator.style.display = 'none';
+}
+
+// Null until the first message of a new chat saves the session
+let sessionId = chatForm.dataset.sessionId ? Number(chatForm.dataset.sessionId) : null;
+
+// Keys of the messages sent from this tab, their pushed copies are skipped
+const sentClientIds = new Set();
+
+// Idempotency key for one message, reused by every retry of that message
+function newClientId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+// POST the message, retrying network errors and 5xx/409 with the same key
+async function postMessage(message, clientId, attempts = 3) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const response = await fetch(chatForm.dataset.sendUrl, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]')?.value || ''
+                },
+                body: JSON.stringify({
+                    session_id: sessionId,
+                    message: message,
+                    client_id: clientId
+                })
+            });
+            const retryable = response.status >= 500 || response.status === 409;
+            if (!retryable || attempt >= attempts) {
+                return response;
+            }
+        } catch (error) {
+            if (attempt >= attempts) throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+    }
+}
+
+// Send message
+async function sendMessage(message) {
+    if (!message.trim() || sendBtn.disabled) return;
+
+    // Add user message
+    const userDiv = addMessage(message, 'user');
+    const clientId = newClientId();
+    sentClientIds.add(clientId);
+
+    // Clear input and disable send button
+    messageInput.value = '';
+    sendBtn.disabled = true;
+    showTyping();
+
+    try {
+        const response = await postMessage(message, clientId);
+
+        const data = await response.json();
+
+        if (data.success) {
+            // Add AI response
+            markRendered(userDiv, data.user_message.id);
+            addMessage(data.ai_message.content, 'ai', null, data.ai_message.id);
+
+            // A new chat was just saved, give the page its real URL and follow it live
+            if (sessionId === null) {
+                sessionId = data.session_id;
+                history.replaceState(null, '', `/chat/${sessionId}/`);
+                connectLive();
+            }
+
+            // Update session title if changed
+            if (data.session_title) {
+                setTitle(data.session_title);
+            }
+        } else {
+            addMessage('Sorry, I encountered an error. Please try again.', 'ai');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        addMessage('Sorry, I couldn\'t process your message. Please check your connection and try again.', 'ai');
+    } finally {
+        hideTyping();
+        sendBtn.disabled = false;
+        messageInput.focus();
+    }
+}
+
+// Live updates: messages sent from other tabs and devices showing this chat
+// Only when the server serves the sockets (settings.REALTIME_ENABLED)
+const liveUpdates = chatForm.dataset.liveUpdates === 'true';
+// Give up after this many connects in a row that never opened
+const MAX_FAILED_CONNECTS = 5;
+let liveSocket = null;
+let reconnectDelay = 1000;
+let failedConnects = 0;
+
+function connectLive() {
+    if (!liveUpdates || sessionId === null || !('WebSocket' in window) || liveSocket) return;
+
+    const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${scheme}://${location.host}/ws/chat/${sessionId}/?after=${lastMessageId}`);
+    liveSocket = socket;
+    const keepAlive = setInterval(() => {
+        if (socket.readyState === WebSocket.OPEN) socket.send('ping');
+    }, 25000);
+
+    let opened = false;
+    socket.onopen = () => {
+        opened = true;
+        failedConnects = 0;
+        reconnectDelay = 1000;
+    };
+    socket.onmessage = (e) => applyLiveEvent(JSON.parse(e.data));
+    socket.onclose = (e) => {
+        clearInterval(keepAlive);
+        liveSocket = null;
+        // 4403: not our chat (or logged out), a page load will sort it out
+        if (e.code === 4403) return;
+        // Sockets aren't being served here, the page still works without them
+        if (!opened && ++failedConnects >= MAX_FAILED_CONNECTS) return;
+        // Anything else reconnects, catching up from the last message we have
+        setTimeout(connectLive, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+    };
+}
+
+function applyLiveEvent(event) {
+    if (event.type === 'reload') {
+        window.location.reload();
+        return;
+    }
+    if (event.type !== 'messages') return;
+
+    // Already on the page if this tab sent it
+    const ownMessage = event.client_id && sentClientIds.has(event.client_id);
+    for (const message of event.messages) {
+        if (renderedIds.has(message.id) || ownMessage) continue;
+        addMessage(message.content, message.type, message.timestamp, message.id);
+    }
+
+    if (event.title) {
+        setTitle(event.title);
+    }
+}
+
+// Quick message sender
+function sendQuickMessage(message) {
+    messageInput.value = message;
+    sendMessage(message);
+}
+
+// Form submission
+chatForm.addEventListener('submit', (e) => {
+    e.preventDefault();
+    const message = messageInput.value.trim();
+    if (message) {
+        sendMessage(message);
+    }
+});
+
+// Enter key handling
+messageInput.addEventListener('keydown', (e) => {
+    if (e.key === 'Enter' && !e.shiftKey) {
+        e.preventDefault();
+        const message = messageInput.value.trim();
+        if (message) {
+            sendMessage(message);
+        }
+    }
+});
+
+// Session management
+function loadSession(sessionId) {
+    window.location.href = `/chat/${sessionId}/`;
+}
+
+function createNewChat() {
+    window.location.href = chatForm.dataset.newChatUrl;
+}
+
+function clearChat() {
+    if (confirm('Are you sure you want to clear this chat? This action cannot be undone.')) {
+        // Reload page to start fresh
+        window.location.reload();
+    }
+}
+
+// Mobile sidebar toggle
+function toggleSidebar() {
+    const sidebar = document.getElementById('chatSidebar');
+    const overlay = document.getElementById('mobileOverlay');
+
+    sidebar.classList.toggle('show');
+    overlay.classList.toggle('show');
+}
+
+// Initialize
+document.addEventListener('DOMContentLoaded', () => {
+    messageInput.focus();
+    scrollToBottom();
+    connectLive();
+
+    // Handle URL parameters (e.g., topic selection)
+    const urlParams = new URLSearchParams(window.location.search);
+    const topic = urlParams.get('topic');
+    if (topic) {
+        messageInput.value = `I need help with ${topic}`;
+        // Auto-send after a brief delay
+        setTimeout(() => {
+            sendMessage(`I need help with ${topic}`);
+        }, 1000);
+    }
+});
+
+// Add CSRF token to all AJAX requests
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
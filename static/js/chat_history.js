@@ -0,0 +1,178 @@
+let sessionToDeleteId = null;
+
+// Open chat session
+function openSession(sessionId) {
+    window.location.href = `/chat/${sessionId}/`;
+}
+
+// Delete session with confirmation
+function deleteSession(event, sessionId) {
+    event.stopPropagation(); // Prevent opening the session
+
+    sessionToDeleteId = sessionId;
+
+    // Get session info for confirmation
+    const sessionCard = event.target.closest('.session-item');
+    const sessionTitle = sessionCard.querySelector('.card-title').textContent.trim();
+    const messageCount = sessionCard.querySelector('.session-stats span').textContent;
+
+    document.getElementById('sessionToDelete').innerHTML = `
+        <strong>Session:</strong> ${sessionTitle}<br>
+        <strong>Messages:</strong> ${messageCount}
+    `;
+
+    // Show confirmation modal
+    new bootstrap.Modal(document.getElementById('deleteModal')).show();
+}
+
+// Confirm deletion
+document.getElementById('confirmDelete').addEventListener('click', async function() {
+    if (!sessionToDeleteId) return;
+
+    try {
+        const response = await fetch(`/chat/delete/${sessionToDeleteId}/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+                'Content-Type': 'application/json'
+            }
+        });
+
+        if (response.ok) {
+            // Remove the session from the page
+            const sessionElement = document.querySelector(`[onclick="openSession(${sessionToDeleteId})"]`).closest('.session-item');
+            sessionElement.style.opacity = '0';
+            setTimeout(() => {
+                sessionElement.remove();
+
+                // Check if no sessions left
+                if (document.querySelectorAll('.session-item').length === 0) {
+                    document.getElementById('sessionsList').innerHTML = `
+                        <div class="col-12">
+                            <div class="empty-state">
+                                <i class="fas fa-comments" style="font-size: 4rem; opacity: 0.3;"></i>
+                                <h4 class="mt-4">No Chat History Yet</h4>
+                                <p class="mb-4">Start your first study session to see your chat history here.</p>
+                                <a href="/chat/" class="btn btn-primary btn-lg">
+                                    <i class="fas fa-plus"></i> Start First Chat
+                                </a>
+                            </div>
+                        </div>
+                    `;
+                }
+            }, 300);
+
+            // Close modal
+            bootstrap.Modal.getInstance(document.getElementById('deleteModal')).hide();
+
+            // Show success message
+            showAlert('Session deleted successfully!', 'success');
+        } else {
+            showAlert('Failed to delete session. Please try again.', 'error');
+        }
+    } catch (error) {
+        showAlert('An error occurred. Please try again.', 'error');
+    }
+
+    sessionToDeleteId = null;
+});
+
+// Search functionality
+document.getElementById('searchInput').addEventListener('input', function() {
+    const searchTerm = this.value.toLowerCase();
+    const sessions = document.querySelectorAll('.session-item');
+
+    sessions.forEach(session => {
+        const title = session.getAttribute('data-title');
+        const content = session.textContent.toLowerCase();
+
+        if (title.includes(searchTerm) || content.includes(searchTerm)) {
+            session.style.display = 'block';
+        } else {
+            session.style.display = 'none';
+        }
+    });
+});
+
+// Filter functionality
+document.querySelectorAll('.filter-tab').forEach(tab => {
+    tab.addEventListener('click', function() {
+        // Update active tab
+        document.querySelectorAll('.filter-tab').forEach(t => t.classList.remove('active'));
+        this.classList.add('active');
+
+        const filter = this.getAttribute('data-filter');
+        const sessions = document.querySelectorAll('.session-item');
+        const now = new Date();
+
+        sessions.forEach(session => {
+            const sessionDate = new Date(session.getAttribute('data-date'));
+            let show = true;
+
+            switch(filter) {
+                case 'today':
+                    show = sessionDate.toDateString() === now.toDateString();
+                    break;
+                case 'week':
+                    const weekAgo = new Date(now.getTime() - 7 * 24 * 60 * 60 * 1000);
+                    show = sessionDate >= weekAgo;
+                    break;
+                case 'month':
+                    const monthAgo = new Date(now.getFullYear(), now.getMonth() - 1, now.getDate());
+                    show = sessionDate >= monthAgo;
+                    break;
+                case 'all':
+                default:
+                    show = true;
+            }
+
+            session.style.display = show ? 'block' : 'none';
+        });
+    });
+});
+
+// Utility functions
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+function showAlert(message, type = 'info') {
+    const alertDiv = document.createElement('div');
+    alertDiv.className = `alert alert-${type === 'error' ? 'danger' : type} alert-dismissible fade show position-fixed`;
+    alertDiv.style.cssText = 'top: 20px; right: 20px; z-index: 9999; min-width: 300px;';
+    alertDiv.innerHTML = `
+        ${message}
+        <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+    `;
+
+    document.body.appendChild(alertDiv);
+
+    // Auto-remove after 5 seconds
+    setTimeout(() => {
+        if (alertDiv.parentNode) {
+            alertDiv.remove();
+        }
+    }, 5000);
+}
+
+// Initialize tooltips
+document.addEventListener('DOMContentLoaded', function() {
+    // Initialize Bootstrap tooltips if available
+    if (typeof bootstrap !== 'undefined' && bootstrap.Tooltip) {
+        var tooltipTriggerList = [].slice.call(document.querySelectorAll('[title]'));
+        var tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
+            return new bootstrap.Tooltip(tooltipTriggerEl);
+        });
+    }
+});
@@ -0,0 +1,107 @@
+// URLs are rendered into the tips modal's data attributes
+const tipsModal = document.getElementById('tipsModal');
+let currentTopic = '';
+
+// Start chat with specific topic
+function startTopicChat(topicName) {
+    // Store topic for potential use
+    sessionStorage.setItem('selectedTopic', topicName);
+
+    // Redirect to new chat with topic parameter
+    window.location.href = `${tipsModal.dataset.newChatUrl}?topic=${encodeURIComponent(topicName)}`;
+}
+
+// Get more tips for a topic
+async function getMoreTips(topicName) {
+    currentTopic = topicName;
+    document.getElementById('modalTopicName').textContent = `${topicName} Study Tips`;
+
+    // Show modal
+    const modal = new bootstrap.Modal(tipsModal);
+    modal.show();
+
+    try {
+        const response = await fetch(`${tipsModal.dataset.tipsUrl}?subject=${encodeURIComponent(topicName)}`);
+        const data = await response.json();
+
+        if (data.success) {
+            displayTips(data.tips, topicName);
+        } else {
+            displayError('Failed to load study tips');
+        }
+    } catch (error) {
+        displayError('Error loading study tips');
+    }
+}
+
+// Display tips in modal
+function displayTips(tips, topicName) {
+    const content = document.getElementById('tipsContent');
+    let html = `
+        <div class="mb-3">
+            <h6 class="text-primary">Effective ${topicName} Study Strategies:</h6>
+        </div>
+    `;
+
+    tips.forEach((tip, index) => {
+        html += `
+            <div class="card mb-2">
+                <div class="card-body py-2">
+                    <div class="d-flex align-items-start">
+                        <span class="badge bg-primary me-2 mt-1">${index + 1}</span>
+                        <span>${tip}</span>
+                    </div>
+                </div>
+            </div>
+        `;
+    });
+
+    html += `
+        <div class="mt-3 p-3 bg-light rounded">
+            <small class="text-muted">
+                <i class="fas fa-info-circle"></i>
+                Want personalized help with ${topicName}? Start a chat session for interactive assistance!
+            </small>
+        </div>
+    `;
+
+    content.innerHTML = html;
+}
+
+// Display error in modal
+function displayError(message) {
+    document.getElementById('tipsContent').innerHTML = `
+        <div class="alert alert-warning">
+            <i class="fas fa-exclamation-triangle"></i>
+            ${message}. Please try again later.
+        </div>
+    `;
+}
+
+// Start chat from modal
+document.getElementById('startChatFromModal').addEventListener('click', function() {
+    if (currentTopic) {
+        startTopicChat(currentTopic);
+    }
+});
+
+// Filter functionality
+document.querySelectorAll('.filter-btn').forEach(btn => {
+    btn.addEventListener('click', function() {
+        // Update active button
+        document.querySelectorAll('.filter-btn').forEach(b => b.classList.remove('active'));
+        this.classList.add('active');
+
+        const filter = this.getAttribute('data-filter');
+        const topics = document.querySelectorAll('.topic-item');
+
+        topics.forEach(topic => {
+            if (filter === 'all' || topic.getAttribute('data-category') === filter) {
+                topic.style.display = 'block';
+                topic.style.animation = 'fadeIn 0.5s';
+            } else {
+                topic.style.display = 'none';
+            }
+        });
+    });
+});
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'study_assistant.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+#Imported once Django is set up
+from base.realtime import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Django for HTTP, the chat sockets (base/realtime.py) for WebSockets"""
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -11,9 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
-import dj_database_url
 from pathlib import Path
-from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,16 +46,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'base.middleware.RequestIDMiddleware',      #after WhiteNoise, static files aren't access logged
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'base.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'base.middleware.ThemeMiddleware',
 ]
 
 ROOT_URLCONF = 'study_assistant.urls'
@@ -84,10 +82,16 @@ TEMPLATES = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 
+# dj_database_url is imported only when a URL has to be parsed, to keep
+# local startup (and every manage.py call) light
+
 if os.getenv('RENDER'):  # Render environment
+    import dj_database_url
+
     DATABASES = {
         'default': dj_database_url.config(
             conn_max_age=600,
+            conn_health_checks=True,
             ssl_require=True
         )
     }
@@ -99,6 +103,92 @@ else:  # Local development fallback
         }
     }
 
+# Optional read replica, e.g. postgres://... in production or
+# sqlite:////path/to/replica.sqlite3 to try the routing locally
+if os.getenv('DATABASE_REPLICA_URL'):
+    import dj_database_url
+
+    DATABASES['replica'] = dj_database_url.parse(
+        os.getenv('DATABASE_REPLICA_URL'),
+        conn_max_age=600,
+        conn_health_checks=True,
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# psycopg 3 connection pooling for PostgreSQL databases (DB_POOL=true).
+# The pool replaces persistent connections, so CONN_MAX_AGE must be 0.
+if os.getenv('DB_POOL', 'false').lower() in ('1', 'true', 'yes'):
+    from psycopg_pool import ConnectionPool
+
+    for db in DATABASES.values():
+        if db['ENGINE'] == 'django.db.backends.postgresql':
+            db['CONN_MAX_AGE'] = 0
+            db['CONN_HEALTH_CHECKS'] = False
+            db.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+                'check': ConnectionPool.check_connection,     #health check on checkout
+            }
+
+# SQLite tuning, run on every new connection. WAL lets readers work next to
+# the single writer, and BEGIN IMMEDIATE takes the write lock when the
+# transaction starts, so concurrent writers wait up to `timeout` seconds
+# instead of failing with "database is locked" halfway through.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',        #safe with WAL, fsync only at checkpoints
+    'PRAGMA cache_size=-20000',         #~20 MB page cache per connection
+    'PRAGMA mmap_size=134217728',       #128 MB memory-mapped reads
+    'PRAGMA temp_store=MEMORY',
+]
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 20))
+
+if os.getenv('SQLITE_TUNING', 'true').lower() in ('1', 'true', 'yes'):
+    for db in DATABASES.values():
+        if db['ENGINE'] == 'django.db.backends.sqlite3':
+            db.setdefault('OPTIONS', {}).update({
+                'init_command': '; '.join(SQLITE_PRAGMAS),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': SQLITE_BUSY_TIMEOUT,
+            })
+
+DATABASE_ROUTERS = ['base.db_router.PrimaryReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write (read-your-writes)
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+# Cache
+# Redis is shared by all gunicorn workers; the local-memory fallback is per process
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Rate limits per URL name ("requests/period", period is s, m, h or d).
+# 'user' applies to each logged-in user, 'ip' to each client IP. The IP limits are
+# higher since a whole school can sit behind one NAT address.
+RATELIMITS = {
+    'send_message': {'user': '20/m', 'ip': '300/m'},
+    'send_batch': {'user': '5/m', 'ip': '60/m'},
+    'get_study_tips': {'user': '60/m', 'ip': '600/m'},
+    'toggle_theme': {'user': '30/m', 'ip': '300/m'},
+}
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATELIMIT_CACHE = 'default'
+# Render terminates TLS in a proxy, so the client IP is in X-Forwarded-For there
+RATELIMIT_IP_HEADER = 'HTTP_X_FORWARDED_FOR' if os.getenv('RENDER') else 'REMOTE_ADDR'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -134,12 +224,22 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = '/static/'
-#STATICFILES_DIRS = [
-#    BASE_DIR / 'static', 
-#]
+STATICFILES_DIRS = [
+    BASE_DIR / 'static', 
+]
 STATIC_ROOT = os.path.join(BASE_DIR , 'staticfiles' ) #BASE_DIR / 'staticfiles'
 
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+#collectstatic minifies our CSS/JS, names files by content hash and writes .gz/.br
+#copies; WhiteNoise serves the hashed names with "immutable" cache headers
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'base.storage.MinifiedManifestStaticFilesStorage',
+    },
+}
+STATIC_MINIFY = os.getenv('STATIC_MINIFY', 'true').lower() in ('1', 'true', 'yes')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -149,23 +249,125 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+#Chat sessions untouched for this many days are moved to ChatArchive by `manage.py archive_chats`
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', 180))
+
+#Chat messages at least this long are stored compressed and deduplicated in MessageBody (0 disables)
+MESSAGE_BODY_MIN_LENGTH = int(os.getenv('MESSAGE_BODY_MIN_LENGTH', 128))
+
+#Deleted chats: messages removed per DELETE statement, and how many messages a
+#request may purge itself (bigger deletions are finished by `manage.py purge_deleted_chats`)
+CHAT_DELETE_BATCH_SIZE = int(os.getenv('CHAT_DELETE_BATCH_SIZE', 1000))
+CHAT_DELETE_INLINE_MAX_MESSAGES = int(os.getenv('CHAT_DELETE_INLINE_MAX_MESSAGES', 500))
+
+#Largest number of questions accepted by the batch message endpoint
+CHAT_BATCH_MAX_QUESTIONS = int(os.getenv('CHAT_BATCH_MAX_QUESTIONS', 25))
+
+#Seconds after which a retried message whose first attempt never got an answer is answered again
+CHAT_REPLY_TIMEOUT = int(os.getenv('CHAT_REPLY_TIMEOUT', 180))
+
+#Text generation backend used by AIService, one of AI_BACKENDS (see base/ai_backends.py)
+AI_BACKEND = os.getenv('AI_BACKEND', 'rules')
+AI_BACKENDS = {
+    #Keyword responder, no model needed
+    'rules': {
+        'BACKEND': 'base.ai_backends.RuleBackend',
+    },
+    #Hosted model behind an HTTP inference API
+    'http': {
+        'BACKEND': 'base.ai_backends.HTTPBackend',
+        'URL': os.getenv('AI_HTTP_URL', 'https://api-inference.huggingface.co/models/microsoft/DialoGPT-large'),
+        'TOKEN': os.getenv('AI_HTTP_TOKEN', ''),
+        'TIMEOUT': float(os.getenv('AI_HTTP_TIMEOUT', 30)),
+    },
+    #Quantized GGUF model on the CPU, for offline deployments (needs pip install llama-cpp-python)
+    'local': {
+        'BACKEND': 'base.ai_backends.LocalBackend',
+        'MODEL_PATH': os.getenv('AI_LOCAL_MODEL_PATH', ''),
+        'WORKERS': int(os.getenv('AI_LOCAL_WORKERS', 1)),      #model instances = concurrent generations
+        'THREADS': int(os.getenv('AI_LOCAL_THREADS', 4)),      #CPU threads per generation
+        'CONTEXT': int(os.getenv('AI_LOCAL_CONTEXT', 2048)),
+        'MAX_TOKENS': int(os.getenv('AI_LOCAL_MAX_TOKENS', 256)),
+    },
+}
+
+#Micro-batching of concurrent generation requests (per process), worth it for
+#backends that answer a batch faster than its prompts one by one
+AI_BATCHING = {
+    'ENABLED': os.getenv('AI_BATCHING', 'false' if AI_BACKEND == 'rules' else 'true').lower() in ('1', 'true', 'yes'),
+    'MAX_BATCH_SIZE': int(os.getenv('AI_BATCH_MAX_SIZE', 8)),
+    'MAX_WAIT_MS': float(os.getenv('AI_BATCH_MAX_WAIT_MS', 10)),    #how long the first request waits for company
+    'MAX_QUEUE': int(os.getenv('AI_BATCH_MAX_QUEUE', 256)),         #requests beyond this get the fallback answer
+    'TIMEOUT': float(os.getenv('AI_BATCH_TIMEOUT', 60)),            #seconds a caller waits for its answer
+}
+
+#Live chat updates over WebSockets (/ws/chat/<id>/, served by study_assistant/asgi.py).
+#Off by default: gunicorn serves the WSGI app only, so turn it on only where an ASGI
+#server (e.g. uvicorn) serves /ws/ and REALTIME_BROKER reaches its processes
+REALTIME_ENABLED = os.getenv('REALTIME_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+#'memory' reaches the sockets of this process only; use 'redis' when pages and
+#sockets are served by different processes or nodes (e.g. WSGI workers plus an ASGI server)
+REALTIME_BROKER = os.getenv('REALTIME_BROKER', 'memory')
+REALTIME_BROKERS = {
+    'memory': {
+        'BACKEND': 'base.realtime.InProcessBroker',
+        'MAX_QUEUE': 100,           #events waiting for one socket before it is closed
+    },
+    'redis': {
+        'BACKEND': 'base.realtime.RedisBroker',
+        'URL': os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+        'PREFIX': 'studyai:chat:',
+        'MAX_QUEUE': 100,
+    },
+}
+REALTIME_MAX_CATCH_UP = 200        #missed messages sent to a reconnecting tab, more and it reloads
+
 #Session configuration for theme persistance'
 SESSION_COOKIE_AGE = 31536000       #1 year
 SESSION_SAVE_EVERY_REQUEST = True
 
 
-import sys
+#Logging: records are queued and written as JSON lines by a background thread
+#(base.log), each with the id of its request. INFO by default; single loggers
+#can be changed with LOG_LEVELS, e.g. "django.db.backends=DEBUG,base.ai_service=DEBUG"
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')        #json or text
+LOG_ACCESS_SAMPLE_RATE = float(os.getenv('LOG_ACCESS_SAMPLE_RATE', 0.1))     #share of access lines kept
+LOG_SLOW_REQUEST_MS = float(os.getenv('LOG_SLOW_REQUEST_MS', 1000))         #always logged, as warnings
+
+LOG_LEVELS = {
+    'django': LOG_LEVEL,
+    'django.db.backends': 'WARNING',        #a line per query at DEBUG
+    'django.template': 'WARNING',
+    'base': LOG_LEVEL,
+    'base.access': 'INFO',                  #one line per request, sampled
+}
+for item in filter(None, os.getenv('LOG_LEVELS', '').split(',')):
+    name, _, level = item.partition('=')
+    LOG_LEVELS[name.strip()] = level.strip().upper()
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'base.log.JSONFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'},
+    },
+    'filters': {
+        'access_sample': {'()': 'base.log.SamplingFilter', 'rate': LOG_ACCESS_SAMPLE_RATE},
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
-            'stream': sys.stdout,
+            '()': 'base.log.BackgroundHandler',
+            'stream': 'ext://sys.stdout',
+            'max_queue': int(os.getenv('LOG_MAX_QUEUE', 10000)),
+            'formatter': LOG_FORMAT,
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': LOG_LEVEL,
     },
-}
\ No newline at end of file
+    'loggers': {name: {'level': level} for name, level in LOG_LEVELS.items()},
+}
+LOGGING['loggers']['base.access']['filters'] = ['access_sample']